@@ -0,0 +1,46 @@
+"""
+Shared setup for the benchmark scripts.
+
+Each benchmark runs against a throwaway SQLite database in a temporary
+directory so it never touches db.sqlite3.
+"""
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(**overrides):
+    """Point Django at a fresh scratch database, apply migrations and return its path."""
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'socialmedia.settings')
+
+    from django.conf import settings
+
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    db_path = Path(tempfile.mkdtemp(prefix='socialmedia-bench-')) / 'bench.sqlite3'
+    settings.DATABASES['default']['NAME'] = db_path
+    replica = getattr(settings, 'READ_REPLICA_ALIAS', None)
+    if replica in settings.DATABASES:
+        settings.DATABASES[replica]['NAME'] = f'file:{db_path}?mode=ro'
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    return db_path
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
@@ -0,0 +1,76 @@
+"""
+Benchmark: likes per second on a single hot post.
+
+Several threads like the same post concurrently, once with every like
+updating core_post.likes_count directly and once through the write-behind
+counter buffer.
+
+    python benchmarks/hot_post_likes.py --users 2000 --threads 8
+"""
+
+import argparse
+import threading
+
+from common import Timer, setup_django
+
+
+def run(users, post, threads, buffered):
+    from django.conf import settings
+    from django.db import connection
+    from core import counter_buffer
+    from core.models import Like, Post
+
+    settings.COUNTER_BUFFER_ENABLED = buffered
+    Like.objects.filter(post=post).delete()
+    counter_buffer.buffer.flush()
+    Post.objects.filter(pk=post.pk).update(likes_count=0)
+
+    errors = []
+
+    def worker(chunk):
+        try:
+            for user in chunk:
+                Like.objects.create(user=user, post=post)
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    chunks = [users[i::threads] for i in range(threads)]
+    workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    with Timer() as timer:
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        counter_buffer.buffer.flush()
+
+    post.refresh_from_db()
+    return len(users) / timer.elapsed, post.likes_count, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    setup_django(COUNTER_BUFFER_FLUSH_INTERVAL=0.5, COUNTER_BUFFER_FLUSH_SIZE=100)
+
+    from django.contrib.auth.models import User
+    from core.models import Post
+
+    author = User.objects.create_user('hot_author')
+    post = Post.objects.create(author=author, content='This one is going viral')
+    User.objects.bulk_create([User(username=f'fan{i}') for i in range(args.users)])
+    users = list(User.objects.filter(username__startswith='fan'))
+
+    for label, buffered in (('direct UPDATE per like', False), ('write-behind buffer', True)):
+        rate, stored, errors = run(users, post, args.threads, buffered)
+        print(f'{label:24s} {rate:10.0f} likes/s   likes_count={stored}   errors={len(errors)}')
+        for exc in errors[:3]:
+            print(f'    {exc!r}')
+
+
+if __name__ == '__main__':
+    main()
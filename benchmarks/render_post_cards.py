@@ -0,0 +1,105 @@
+"""
+Benchmark: template render time of a feed page with and without fragment caching.
+
+Renders core/feed.html for one page of posts (each with an author avatar,
+image renditions and tags) three ways: the template with its {% cache %}
+tags stripped (how it rendered before fragment caching), with the fragment
+cache cold (every card rendered and stored) and warm (every card a hit, only
+the like button and relative time rendered per viewer).
+
+    python benchmarks/render_post_cards.py --per-page 10 --repeat 200
+"""
+
+import argparse
+import re
+import statistics
+
+from common import Timer, setup_django
+
+
+def make_posts(count):
+    from django.contrib.auth.models import User
+    from core.models import Post, Tag, UserProfile
+
+    def renditions(stem, widths, source):
+        return {
+            'source': source, 'width': widths[-1], 'height': widths[-1],
+            'webp': [{'width': w, 'name': f'renditions/{stem}-{w}.webp'} for w in widths],
+            'jpeg': [{'width': w, 'name': f'renditions/{stem}-{w}.jpeg'} for w in widths],
+        }
+
+    authors = []
+    for i in range(count):
+        author = User.objects.create_user(f'author{i}')
+        picture = f'blobs/aa/bb/avatar{i}.jpg'
+        UserProfile.objects.filter(user=author).update(
+            profile_picture=picture, picture_renditions=renditions(f'avatar{i}', [64, 150, 320], picture)
+        )
+        authors.append(author)
+    tags = Tag.objects.bulk_create([Tag(name=f'tag{i}', slug=f'tag{i}') for i in range(5)])
+    for i, author in enumerate(authors):
+        image = f'blobs/cc/dd/image{i}.jpg'
+        post = Post.objects.create(
+            author=author, content=f'Post number {i} with a caption long enough to wrap a line or two. ' * 3,
+            image=image, image_renditions=renditions(f'image{i}', [320, 640, 1080], image),
+            likes_count=i * 7, comments_count=i,
+        )
+        post.tags.set(tags[: 1 + i % 5])
+    return authors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--per-page', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.contrib.auth.models import User
+    from django.core.cache import cache
+    from django.template import engines
+    from django.template.loader import get_template
+    from django.test import RequestFactory
+    from core import counter_buffer, fragments, viewer_state
+    from core.models import Post
+
+    make_posts(args.per_page)
+    viewer = User.objects.create_user('viewer')
+    request = RequestFactory().get('/')
+    request.user = viewer
+
+    posts = list(Post.objects.select_related('author', 'author__profile').prefetch_related('tags'))
+    viewer_state.attach(viewer, posts)
+    counter_buffer.apply_pending(posts)
+    fragments.attach_versions(posts)
+    context = {'posts': posts}
+
+    cached = get_template('core/feed.html')
+    with open(cached.origin.name) as f:
+        source = re.sub(r'[ \t]*\{% (end)?cache[^%]*%\}\n', '', f.read())
+    uncached = engines['django'].from_string(source)
+
+    def measure(template, before=None):
+        timings = []
+        for _ in range(args.repeat):
+            if before:
+                before()
+            with Timer() as timer:
+                template.render(context, request)
+            timings.append(timer.elapsed * 1000)
+        return statistics.median(timings)
+
+    baseline = measure(uncached)
+    cold = measure(cached, before=cache.clear)
+    cached.render(context, request)
+    warm = measure(cached)
+
+    print(f'feed page of {len(posts)} posts, median of {args.repeat} renders')
+    print(f'  no fragment cache      {baseline:8.2f} ms')
+    print(f'  fragment cache, cold   {cold:8.2f} ms')
+    print(f'  fragment cache, warm   {warm:8.2f} ms   ({baseline / warm:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark: FTS5 search against the LIKE '%q%' baseline.
+
+Fills a scratch database with synthetic posts (Zipf-distributed words, so
+there are both very common and very rare terms), builds the full-text index
+and times the first page of results for a mix of queries both ways.
+
+LIKE returns the newest matches unranked and can stop after 20 hits, so it
+only keeps up on very common terms; it scans the whole table for rare ones.
+FTS5 only touches matching rows, but has to rank all of them, so the most
+common words are its slowest queries.
+
+    python benchmarks/search_vs_like.py --posts 1000000
+"""
+
+import argparse
+import itertools
+import random
+import statistics
+
+from common import Timer, setup_django
+
+VOCABULARY = 20000
+WORDS_PER_POST = 12
+
+
+def make_words(n, rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = set()
+    while len(words) < n:
+        words.add(''.join(rng.choice(letters) for _ in range(rng.randint(4, 9))))
+    return sorted(words)
+
+
+def fill(posts, rng):
+    from django.contrib.auth.models import User
+    from core import fulltext
+    from core.models import Post
+
+    words = make_words(VOCABULARY, rng)
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    authors = User.objects.bulk_create([User(username=f'author{i}') for i in range(100)])
+
+    batch = 10000
+    with Timer() as insert:
+        for start in range(0, posts, batch):
+            Post.objects.bulk_create([
+                Post(author=rng.choice(authors), content=' '.join(rng.choices(words, cum_weights=cum_weights, k=WORDS_PER_POST)))
+                for _ in range(min(batch, posts - start))
+            ])
+    with Timer() as index:
+        fulltext.rebuild()
+    print(f'inserted {posts} posts in {insert.elapsed:.1f}s, indexed in {index.elapsed:.1f}s')
+    return words
+
+
+def time_queries(label, queries, run, repeat):
+    timings = []
+    for query in queries:
+        for _ in range(repeat):
+            with Timer() as timer:
+                run(query)
+            timings.append(timer.elapsed * 1000)
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f'  {label:22s} median {statistics.median(timings):9.2f} ms   p95 {p95:9.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from core import fulltext
+    from core.models import Post
+
+    rng = random.Random(args.seed)
+    words = fill(args.posts, rng)
+
+    def like(query):
+        return list(Post.objects.filter(content__icontains=query).order_by('-id')[:20])
+
+    def fts(query):
+        return list(fulltext.search(query, 'posts', per_page=20))
+
+    groups = {
+        'common words': words[:args.queries],
+        'rare words': words[-args.queries:],
+        'prefixes': [word[:3] for word in rng.sample(words[:2000], args.queries)],
+    }
+    for name, queries in groups.items():
+        print(name)
+        time_queries("LIKE '%q%'", queries, like, args.repeat)
+        time_queries('FTS5 MATCH + bm25', queries, fts, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark: concurrent likes and feed reads against SQLite, before and after the production profile.
+
+Writer threads toggle likes on a handful of hot posts through the like_post
+view while reader threads load the feed, all at once, for a fixed time.
+Errors are counted both in the requests and in what gets logged by the
+background writers (notification dispatch, counter flushes). The
+"baseline" profile is the old configuration (rollback journal, the sqlite3
+module's 5 s timeout, deferred transactions, a new connection per request,
+no read-only connection); "production" is the shipped settings (WAL and the
+other SQLITE_PRAGMAS, IMMEDIATE transactions, persistent connections, read-only
+views on the replica alias). Each profile runs in its own process on a fresh
+database.
+
+    python benchmarks/sqlite_concurrency.py --writers 8 --readers 4 --seconds 10
+"""
+
+import argparse
+import logging
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from common import Timer, setup_django
+
+PROFILES = ('baseline', 'production')
+
+
+# The settings before the production profile
+BASELINE = {
+    'DATABASES': {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ''}},
+    'DATABASE_ROUTERS': [],
+    'SQLITE_PRAGMAS': {},
+    'READ_REPLICA_ALIAS': None,
+}
+
+
+class LockErrors(logging.Handler):
+    """Counts errors logged by background threads instead of printing their tracebacks."""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(str(record.exc_info[1]) if record.exc_info else record.getMessage())
+
+
+def percentile(values, fraction):
+    return sorted(values)[int(fraction * (len(values) - 1))] if values else 0.0
+
+
+def run(args):
+    overrides = BASELINE if args.profile == 'baseline' else {}
+    setup_django(DEBUG=False, ALLOWED_HOSTS=['testserver'], **overrides)
+
+    from django.contrib.auth.models import User
+    from django.db import OperationalError, close_old_connections, connections
+    from django.test import Client
+    from core.models import Follow, Post
+
+    author = User.objects.create_user('hot_author')
+    posts = [Post.objects.create(author=author, content=f'Hot post {i}') for i in range(args.posts)]
+    users = [User.objects.create_user(f'user{i}') for i in range(args.writers + args.readers)]
+    Follow.objects.bulk_create([Follow(follower=user, following=author) for user in users])
+    connections.close_all()
+    background = LockErrors()
+    logging.getLogger().addHandler(background)
+
+    stop = threading.Event()
+    results = {'write': [], 'read': []}
+    errors = {'write': [], 'read': []}
+    lock = threading.Lock()
+
+    def worker(user, kind, seed):
+        rng = random.Random(seed)
+        client = Client()
+        client.force_login(user)
+        timings, failures = [], []
+        while not stop.is_set():
+            with Timer() as timer:
+                try:
+                    if kind == 'write':
+                        response = client.post(f'/post/{rng.choice(posts).pk}/like/')
+                    else:
+                        response = client.get('/')
+                    if response.status_code != 200:
+                        failures.append(f'HTTP {response.status_code}')
+                except OperationalError as exc:
+                    failures.append(str(exc))
+            timings.append(timer.elapsed * 1000)
+            # What request_finished does for a real request
+            close_old_connections()
+        connections.close_all()
+        with lock:
+            results[kind] += timings
+            errors[kind] += failures
+
+    roles = ['write'] * args.writers + ['read'] * args.readers
+    threads = [threading.Thread(target=worker, args=(user, kind, i)) for i, (user, kind) in enumerate(zip(users, roles))]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    print(f'{args.profile} ({args.writers} writers, {args.readers} readers, {args.seconds:g} s)')
+    for kind, label in (('write', 'likes'), ('read', 'feed reads')):
+        timings = results[kind]
+        print(
+            f'  {label:10s} {len(timings) / args.seconds:8.0f}/s   '
+            f'p50 {statistics.median(timings) if timings else 0:7.1f} ms   p99 {percentile(timings, 0.99):7.1f} ms   '
+            f'errors {len(errors[kind])}'
+        )
+        for message in sorted(set(errors[kind]))[:3]:
+            print(f'      {message}')
+    print(f'  background errors {len(background.messages)}')
+    for message in sorted(set(background.messages))[:3]:
+        print(f'      {message}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--posts', type=int, default=5)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--profile', choices=PROFILES, help='run one profile (default: both, each in a subprocess)')
+    args = parser.parse_args()
+
+    if args.profile:
+        run(args)
+        return
+    for profile in PROFILES:
+        subprocess.run([sys.executable, __file__, *sys.argv[1:], '--profile', profile], check=True)
+
+
+if __name__ == '__main__':
+    main()
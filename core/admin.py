@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UserProfile, Post, Tag, Like, Comment, Follow, Notification, Message
+from .models import UserProfile, Post, Tag, Like, Comment, Follow, Notification, PendingNotification, Message, MediaBlob
 
 
 @admin.register(UserProfile)
@@ -52,17 +52,30 @@ class FollowAdmin(admin.ModelAdmin):
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ['user', 'notification_type', 'is_read', 'created_at']
+    list_display = ['user', 'notification_type', 'actor_count', 'is_read', 'updated_at']
     list_filter = ['notification_type', 'is_read', 'created_at']
     search_fields = ['user__username']
 
 
+@admin.register(PendingNotification)
+class PendingNotificationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'payload', 'created_at']
+    list_filter = ['created_at']
+
+
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ['sender', 'receiver', 'content_preview', 'is_read', 'created_at']
-    list_filter = ['is_read', 'created_at']
+    list_display = ['sender', 'receiver', 'content_preview', 'created_at']
+    list_filter = ['created_at']
     search_fields = ['sender__username', 'receiver__username', 'content']
     
     def content_preview(self, obj):
         return obj.content[:50] + "..." if len(obj.content) > 50 else obj.content
     content_preview.short_description = 'Content'
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'size', 'refcount', 'created_at', 'updated_at']
+    list_filter = ['created_at']
+    search_fields = ['name']
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from . import autocomplete, blobs, checks, conversations, counter_buffer, db, follow_graph, fragments, fulltext, media, timeline, trending  # noqa: F401  (registers signal receivers and checks)
@@ -0,0 +1,306 @@
+"""
+In-memory prefix index behind ``@username`` and ``#hashtag`` autocomplete.
+
+Each process keeps usernames and tag names in a sorted list (lower-cased)
+with parallel ``array('i')`` columns of ids and scores (``followers_count``,
+``usage_count``), so a prefix is a ``bisect`` range and a keystroke never
+queries ``auth_user`` or ``core_tag``. A dict from id to key lets updates
+find an entry by ``bisect`` too. Prefixes matching more than
+``SCAN_LIMIT`` names (``'a'``, or just ``'@'``) keep a precomputed top
+``TOP_K`` so they are not ranked from scratch on every keystroke.
+
+Indexes are loaded on first use and patched by signals on signup, rename,
+deactivation, tag creation, follows and tag use (``core.tags`` patches
+bulk-created tags itself), once the change commits. Other processes only see a change after their next reload, every
+``AUTOCOMPLETE_REFRESH_SECONDS``, which also repairs any drift.
+"""
+
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Follow, Tag
+
+SCAN_LIMIT = 1000
+TOP_K = 10
+
+# Sorts after any character a name can continue with
+_END = '\U0010ffff'
+
+
+class PrefixIndex:
+    """Names sorted for prefix lookups, each with an id and a score; lookups return ``(name, id, score)``."""
+
+    def __init__(self, entries):
+        entries = sorted((name.lower(), pk, score, name) for name, pk, score in entries)
+        self._lock = threading.RLock()
+        self._keys = [key for key, _, _, _ in entries]
+        self._ids = array('i', (pk for _, pk, _, _ in entries))
+        self._scores = array('i', (score for _, _, score, _ in entries))
+        # Only names that differ from their lower-cased key are stored twice
+        self._names = {pk: name for key, pk, _, name in entries if name != key}
+        self._keys_by_id = {pk: key for key, pk, _, _ in entries}
+        self._top = {}
+        self._build_top('', 0, len(self._keys))
+
+    def __contains__(self, pk):
+        return pk in self._keys_by_id
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _range(self, prefix):
+        return bisect_left(self._keys, prefix), bisect_left(self._keys, prefix + _END)
+
+    def _best(self, lo, hi, limit):
+        # Highest score first, then alphabetical
+        return heapq.nsmallest(limit, ((-self._scores[i], self._keys[i], self._ids[i]) for i in range(lo, hi)))
+
+    def _build_top(self, prefix, lo, hi):
+        if hi - lo <= SCAN_LIMIT:
+            return
+        self._top[prefix] = self._best(lo, hi, TOP_K)
+        # Only prefixes whose range is still too big to scan need their own list
+        position = lo
+        while position < hi:
+            key = self._keys[position]
+            if len(key) <= len(prefix):
+                position += 1
+                continue
+            child = key[:len(prefix) + 1]
+            end = bisect_left(self._keys, child + _END, position, hi)
+            self._build_top(child, position, end)
+            position = end
+
+    def _update_top(self, key, pk, score, dropped):
+        """Fix the top lists of ``key``'s prefixes after ``pk`` was added, rescored or (``score=None``) removed."""
+        for length in range(len(key) + 1):
+            prefix = key[:length]
+            top = self._top.get(prefix)
+            lo, hi = self._range(prefix)
+            if top is None:
+                if hi - lo <= SCAN_LIMIT:
+                    # Longer prefixes match even fewer names
+                    break
+                self._top[prefix] = self._best(lo, hi, TOP_K)
+                continue
+            member = any(entry[2] == pk for entry in top)
+            if member and dropped:
+                # Someone outside the list may now outrank it
+                self._top[prefix] = self._best(lo, hi, TOP_K)
+            elif score is not None and (member or len(top) < TOP_K or (-score, key, pk) < top[-1]):
+                entries = [entry for entry in top if entry[2] != pk]
+                insort(entries, (-score, key, pk))
+                self._top[prefix] = entries[:TOP_K]
+
+    def _position(self, pk):
+        key = self._keys_by_id.get(pk)
+        if key is None:
+            return None
+        # Only names that lower-case alike share a key, so this run is short
+        for position in range(bisect_left(self._keys, key), bisect_right(self._keys, key)):
+            if self._ids[position] == pk:
+                return position
+        return None
+
+    def lookup(self, prefix, limit=TOP_K):
+        prefix = prefix.lower()
+        with self._lock:
+            top = self._top.get(prefix)
+            if top is not None and limit <= TOP_K:
+                best = top[:limit]
+            else:
+                best = self._best(*self._range(prefix), limit)
+            return [(self._names.get(pk, key), pk, -score) for score, key, pk in best]
+
+    def add(self, name, pk, score=0):
+        key = name.lower()
+        with self._lock:
+            if pk in self._keys_by_id:
+                return
+            position = bisect_left(self._keys, key)
+            self._keys.insert(position, key)
+            self._ids.insert(position, pk)
+            self._scores.insert(position, score)
+            if name != key:
+                self._names[pk] = name
+            self._keys_by_id[pk] = key
+            self._update_top(key, pk, score, dropped=False)
+
+    def remove(self, pk):
+        with self._lock:
+            position = self._position(pk)
+            if position is None:
+                return
+            key = self._keys.pop(position)
+            del self._ids[position]
+            del self._scores[position]
+            self._names.pop(pk, None)
+            del self._keys_by_id[pk]
+            self._update_top(key, pk, None, dropped=True)
+
+    def rename(self, pk, name):
+        with self._lock:
+            position = self._position(pk)
+            if position is None or self._names.get(pk, self._keys[position]) == name:
+                return
+            score = self._scores[position]
+            self.remove(pk)
+            self.add(name, pk, score)
+
+    def adjust(self, pk, delta):
+        with self._lock:
+            position = self._position(pk)
+            if position is None:
+                return
+            self._scores[position] += delta
+            self._update_top(self._keys[position], pk, self._scores[position], dropped=delta < 0)
+
+
+def _load_users():
+    return PrefixIndex(
+        (username, pk, followers or 0)
+        for username, pk, followers in User.objects.filter(is_active=True).values_list(
+            'username', 'pk', 'profile__followers_count'
+        ).iterator(chunk_size=10000)
+    )
+
+
+def _load_tags():
+    return PrefixIndex(Tag.objects.values_list('name', 'pk', 'usage_count').iterator(chunk_size=10000))
+
+
+LOADERS = {'users': _load_users, 'tags': _load_tags}
+
+_indexes = {}
+_loaded_at = {}
+_reloading = set()
+_lock = threading.Lock()
+
+
+def _reload(kind):
+    try:
+        index = LOADERS[kind]()
+        with _lock:
+            _indexes[kind], _loaded_at[kind] = index, time.monotonic()
+    finally:
+        with _lock:
+            _reloading.discard(kind)
+
+
+def get_index(kind):
+    """The ``PrefixIndex`` for ``'users'`` or ``'tags'``, loading it on first use."""
+    with _lock:
+        index = _indexes.get(kind)
+        stale = index is not None and kind not in _reloading and (
+            time.monotonic() - _loaded_at[kind] > getattr(settings, 'AUTOCOMPLETE_REFRESH_SECONDS', 600)
+        )
+        if stale:
+            _reloading.add(kind)
+    if index is None:
+        # The first request waits; concurrent ones may load it twice, which is harmless
+        index = LOADERS[kind]()
+        with _lock:
+            index = _indexes.setdefault(kind, index)
+            _loaded_at.setdefault(kind, time.monotonic())
+    elif stale:
+        # Keep answering from the current index while the new one loads
+        threading.Thread(target=_reload, args=(kind,), name=f'autocomplete-{kind}', daemon=True).start()
+    return index
+
+
+def _loaded(kind):
+    """The index if it is loaded; changes before the first load are picked up by the load itself."""
+    return _indexes.get(kind)
+
+
+def _on_commit(kind, change):
+    """Apply ``change(index)`` once the current transaction commits, if the index is loaded by then."""
+    def apply():
+        index = _loaded(kind)
+        if index is not None:
+            change(index)
+    transaction.on_commit(apply)
+
+
+def suggest(kind, prefix, limit=TOP_K):
+    """Best ``(name, id, score)`` matches for ``prefix``, highest score first."""
+    return get_index(kind).lookup(prefix, limit)
+
+
+def add_tags(tags):
+    entries = [(tag.name, tag.pk, tag.usage_count) for tag in tags]
+
+    def add(index):
+        for entry in entries:
+            index.add(*entry)
+    _on_commit('tags', add)
+
+
+def count_tag_uses(tag_ids, delta=1):
+    tag_ids = list(tag_ids)
+
+    def adjust(index):
+        for tag_id in tag_ids:
+            index.adjust(tag_id, delta)
+    _on_commit('tags', adjust)
+
+
+def _reindex_user(index, pk, username, is_active, created):
+    if not is_active:
+        index.remove(pk)
+    elif created:
+        # Follows made in the same transaction are counted by their own signals
+        index.add(username, pk)
+    elif pk in index:
+        index.rename(pk, username)
+    else:
+        # Reactivated
+        followers = User.objects.filter(pk=pk).values_list('profile__followers_count', flat=True).first()
+        index.add(username, pk, followers or 0)
+
+
+@receiver(post_save, sender=User)
+def index_user_on_save(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is None or {'username', 'is_active'} & set(update_fields):
+        pk, username, is_active = instance.pk, instance.username, instance.is_active
+        _on_commit('users', lambda index: _reindex_user(index, pk, username, is_active, created))
+
+
+@receiver(post_delete, sender=User)
+def remove_user_on_delete(sender, instance, **kwargs):
+    pk = instance.pk
+    _on_commit('users', lambda index: index.remove(pk))
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, **kwargs):
+    if created:
+        following_id = instance.following_id
+        _on_commit('users', lambda index: index.adjust(following_id, 1))
+
+
+@receiver(post_delete, sender=Follow)
+def count_unfollow(sender, instance, **kwargs):
+    following_id = instance.following_id
+    _on_commit('users', lambda index: index.adjust(following_id, -1))
+
+
+@receiver(post_save, sender=Tag)
+def index_tag_on_save(sender, instance, created, **kwargs):
+    if created:
+        add_tags([instance])
+
+
+@receiver(post_delete, sender=Tag)
+def remove_tag_on_delete(sender, instance, **kwargs):
+    pk = instance.pk
+    _on_commit('tags', lambda index: index.remove(pk))
@@ -0,0 +1,71 @@
+"""
+Unread notification and message counts for the navigation badges.
+
+Both are maintained on ``UserProfile`` as events happen, so showing them never
+counts rows: notifications add one per new unread notification and drop back
+to zero on "mark all as read"; messages add one per received message and are
+re-summed from the reader's ``Conversation`` rows whenever a read watermark
+moves. Reads go through the cache, so a page view normally costs no query at
+all for the badges. Changes drop the cached counts once they commit, so a
+concurrent read can never cache the value from before the change.
+"""
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import UserProfile, Conversation
+
+FIELDS = {'notifications': 'unread_notifications_count', 'messages': 'unread_messages_count'}
+
+# Bounds how long a counter fixed outside this module (e.g. reconcile_counters) can look stale
+CACHE_TIMEOUT = 300
+
+
+def _key(user_id):
+    return f'badges:{user_id}'
+
+
+def _invalidate(user_ids):
+    keys = [_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def counts(user_id):
+    """``{'notifications': n, 'messages': n}`` for one user."""
+    key = _key(user_id)
+    badges = cache.get(key)
+    if badges is None:
+        row = UserProfile.objects.filter(user_id=user_id).values(*FIELDS.values()).first() or {}
+        badges = {name: row.get(field, 0) for name, field in FIELDS.items()}
+        cache.set(key, badges, CACHE_TIMEOUT)
+    return badges
+
+
+def adjust(name, deltas):
+    """Apply ``{user_id: delta}`` to one badge counter in a single ``UPDATE``."""
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    field = FIELDS[name]
+    UserProfile.objects.filter(user_id__in=deltas).update(**{field: F(field) + Case(
+        *[When(user_id=user_id, then=Value(delta)) for user_id, delta in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )})
+    _invalidate(deltas)
+
+
+def reset(name, user_id):
+    UserProfile.objects.filter(user_id=user_id).update(**{FIELDS[name]: 0})
+    _invalidate([user_id])
+
+
+def resum_messages(user_id):
+    """Recompute a user's unread message count from their conversations after a watermark moved."""
+    unread = Conversation.objects.filter(owner_id=OuterRef('user_id')).order_by().values('owner').annotate(
+        n=Sum('unread_count')
+    ).values('n')
+    UserProfile.objects.filter(user_id=user_id).update(unread_messages_count=Coalesce(Subquery(unread), 0))
+    _invalidate([user_id])
@@ -0,0 +1,166 @@
+"""
+Reference counts for content-addressed media blobs (see ``core.storage``).
+
+Every file field in ``REFERENCES`` that holds a blob name counts as one
+reference on its ``MediaBlob`` row. Saves compare the row's previous names
+(read in ``pre_save``) with the new ones and move the counts in the same
+transaction, and deletes release theirs. ``collect`` deletes blobs that have
+had no references for the grace period, plus files that never got a row
+(e.g. an upload whose request failed after the file was written).
+``recount`` rebuilds the counts from the referencing columns if they drift.
+"""
+
+import os
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import MediaBlob, Post, UserProfile
+from .storage import BLOB_PREFIX, TMP_DIR, blob_storage, is_blob
+
+# File fields whose values reference blobs
+FIELDS = {
+    Post: ['image', 'video'],
+    UserProfile: ['profile_picture'],
+}
+REFERENCES = [(model, field) for model, fields in FIELDS.items() for field in fields]
+
+
+def _names(instance):
+    return Counter(
+        name for name in (getattr(instance, field).name for field in FIELDS[type(instance)]) if is_blob(name)
+    )
+
+
+def _size(name):
+    try:
+        return blob_storage.size(name)
+    except OSError:
+        return 0
+
+
+def adjust(deltas):
+    """Apply ``{name: delta}`` to the blobs' reference counts, creating rows for new blobs."""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    MediaBlob.objects.bulk_create(
+        [MediaBlob(name=name, size=_size(name)) for name, delta in deltas.items() if delta > 0],
+        ignore_conflicts=True,
+    )
+    now = timezone.now()
+    for delta in set(deltas.values()):
+        MediaBlob.objects.filter(name__in=[name for name, d in deltas.items() if d == delta]).update(
+            refcount=F('refcount') + delta, updated_at=now
+        )
+
+
+def recount(dry_run=False):
+    """Recompute every reference count from the referencing columns; returns the number of blobs corrected."""
+    actual = Counter()
+    for model, field in REFERENCES:
+        actual.update(
+            name for name in model.objects.filter(**{f'{field}__startswith': BLOB_PREFIX + '/'}).values_list(field, flat=True)
+        )
+    stored = dict(MediaBlob.objects.values_list('name', 'refcount'))
+    deltas = {name: actual.get(name, 0) - stored.get(name, 0) for name in set(actual) | set(stored)}
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not dry_run:
+        adjust(deltas)
+    return len(deltas)
+
+
+def _blob_files():
+    """Relative names of every blob file on disk, excluding in-progress uploads."""
+    root = blob_storage.path(BLOB_PREFIX)
+    for directory, subdirectories, files in os.walk(root):
+        if directory == root and TMP_DIR in subdirectories:
+            subdirectories.remove(TMP_DIR)
+        for filename in files:
+            yield os.path.relpath(os.path.join(directory, filename), blob_storage.location).replace(os.sep, '/')
+
+
+def _older_than(path, cutoff):
+    try:
+        return os.stat(path).st_mtime < cutoff
+    except FileNotFoundError:
+        return False
+
+
+def collect(grace=timedelta(hours=24), dry_run=False):
+    """
+    Delete unreferenced blobs and orphaned files older than ``grace``.
+
+    Returns ``(blobs deleted, bytes freed)``. The grace period covers uploads
+    that are written before the row referencing them is committed; the storage
+    refreshes a blob's mtime whenever it is uploaded again.
+    """
+    cutoff = time.time() - grace.total_seconds()
+    deleted = freed = 0
+
+    for blob in MediaBlob.objects.filter(refcount__lte=0, updated_at__lt=timezone.now() - grace).iterator():
+        path = blob_storage.path(blob.name)
+        if os.path.exists(path) and not _older_than(path, cutoff):
+            continue
+        if not dry_run:
+            # Only if nothing took a reference since the query
+            if not MediaBlob.objects.filter(pk=blob.pk, refcount__lte=0).delete()[0]:
+                continue
+            blob_storage.delete(blob.name)
+        deleted += 1
+        freed += blob.size
+
+    known = set(MediaBlob.objects.values_list('name', flat=True))
+    for name in _blob_files():
+        path = blob_storage.path(name)
+        if name in known or not _older_than(path, cutoff):
+            continue
+        size = _size(name)
+        if not dry_run:
+            blob_storage.delete(name)
+        deleted += 1
+        freed += size
+
+    tmp_dir = blob_storage.path(os.path.join(BLOB_PREFIX, TMP_DIR))
+    if os.path.isdir(tmp_dir) and not dry_run:
+        for filename in os.listdir(tmp_dir):
+            path = os.path.join(tmp_dir, filename)
+            if _older_than(path, cutoff):
+                os.remove(path)
+    return deleted, freed
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=UserProfile)
+def remember_blobs(sender, instance, update_fields=None, **kwargs):
+    fields = FIELDS[sender]
+    if update_fields is not None and not set(fields) & set(update_fields):
+        instance._previous_blobs = None
+        return
+    previous = None
+    if instance.pk is not None:
+        previous = sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+    instance._previous_blobs = Counter(name for name in previous or () if is_blob(name))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=UserProfile)
+def count_blob_references(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_blobs', None)
+    if previous is None:
+        return
+    deltas = _names(instance)
+    deltas.subtract(previous)
+    adjust(deltas)
+    instance._previous_blobs = None
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=UserProfile)
+def release_blob_references(sender, instance, **kwargs):
+    adjust({name: -count for name, count in _names(instance).items()})
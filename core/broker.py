@@ -0,0 +1,90 @@
+"""
+Publish/subscribe for real-time chat events.
+
+``send_message`` publishes each new message to the conversation's channel and
+the streaming endpoint subscribes to it, so an idle chat costs an open
+connection and nothing else. The default ``InProcessBroker`` only reaches
+subscribers in the same process; set ``CHAT_BROKER`` to a dotted path of a
+class with the same ``publish``/``subscribe`` interface (e.g. one backed by
+Redis pub/sub) to fan events out across workers.
+"""
+
+import asyncio
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+def chat_channel(user_id, other_user_id):
+    low, high = sorted((user_id, other_user_id))
+    return f'chat:{low}:{high}'
+
+
+class Subscription:
+    """Events for one channel, delivered to the event loop that subscribed."""
+
+    def __init__(self, broker, channel, maxsize=100):
+        self.broker = broker
+        self.channel = channel
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=maxsize)
+
+    def _deliver(self, event):
+        if self._queue.full():
+            # A stalled client only loses its oldest events; it catches up from the database on reconnect
+            self._queue.get_nowait()
+        self._queue.put_nowait(event)
+
+    def put(self, event):
+        """Called from any thread by the broker."""
+        self._loop.call_soon_threadsafe(self._deliver, event)
+
+    async def get(self, timeout=None):
+        """Next event, or ``None`` if nothing arrives within ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def subscribe(self, channel):
+        """Subscribe the running event loop to ``channel``; call ``close()`` on the result when done."""
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'CHAT_BROKER', 'core.broker.InProcessBroker'))()
+        return _broker
@@ -0,0 +1,22 @@
+"""System checks for the project's own settings."""
+
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+@register()
+def check_trending_weights(app_configs, **kwargs):
+    # Contributions are kept as log2(weight), which only exists for positive weights
+    from .trending import DEFAULT_WEIGHTS
+
+    weights = getattr(settings, 'TRENDING_WEIGHTS', DEFAULT_WEIGHTS)
+    errors = []
+    for kind in DEFAULT_WEIGHTS:
+        value = weights.get(kind)
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+            errors.append(Error(
+                f'TRENDING_WEIGHTS[{kind!r}] must be a number greater than 0, not {value!r}.',
+                hint='Lower a weight to make an engagement count for less; it cannot be switched off.',
+                id='core.E001',
+            ))
+    return errors
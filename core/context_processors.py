@@ -0,0 +1,11 @@
+from django.utils.functional import SimpleLazyObject
+
+from . import badges as badge_counts
+
+
+def badges(request):
+    """Unread notification/message counts for the nav, loaded only if a template uses them."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    return {'badges': SimpleLazyObject(lambda: badge_counts.counts(user.id))}
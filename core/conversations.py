@@ -0,0 +1,121 @@
+"""
+Maintenance of the ``Conversation`` inbox summaries.
+
+Every new message refreshes both participants' rows and bumps the
+recipient's unread counter. Reading moves the reader's watermark forward
+and recounts what is left past it, in one ``UPDATE`` that only matches when
+the watermark actually moves.
+
+Each thread also has a version stamp, read from the reader's row: its last
+message and the partner's read watermark. Both are written in the same
+transaction as the change they reflect, so every worker sees a new stamp as
+soon as the change commits, and ``get_messages`` can answer an unchanged poll
+after one indexed read instead of loading the thread.
+"""
+
+from django.db import transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import badges
+from .broker import chat_channel, get_broker
+from .models import Conversation, Message
+
+PREVIEW_LENGTH = Conversation._meta.get_field('last_message_preview').max_length
+
+
+def record_message(message):
+    sender_id, receiver_id = message.sender_id, message.receiver_id
+    Conversation.objects.bulk_create(
+        [
+            Conversation(owner_id=sender_id, partner_id=receiver_id, last_message_at=message.created_at),
+            Conversation(owner_id=receiver_id, partner_id=sender_id, last_message_at=message.created_at),
+        ],
+        ignore_conflicts=True,
+    )
+
+    unread_count = F('unread_count')
+    if sender_id != receiver_id:
+        unread_count = Case(When(owner_id=receiver_id, then=F('unread_count') + 1), default=F('unread_count'))
+
+    Conversation.objects.filter(
+        Q(owner_id=sender_id, partner_id=receiver_id) | Q(owner_id=receiver_id, partner_id=sender_id)
+    ).update(
+        last_message=message,
+        last_message_preview=message.content[:PREVIEW_LENGTH],
+        last_message_at=message.created_at,
+        unread_count=unread_count,
+    )
+    if sender_id != receiver_id:
+        badges.adjust('messages', {receiver_id: 1})
+
+
+def thread(user, other_user, *related, **filters):
+    """
+    Messages between two users, to be ordered by ``created_at`` or ``id``.
+
+    An ``OR`` over both directions has to be sorted as a whole; as a
+    ``UNION ALL`` each direction is read in index order
+    (``message_pair_created_idx`` or ``message_thread_idx``) and SQLite merges
+    the two, stopping at the slice. ``related`` is passed to ``select_related``
+    and ``filters`` apply to both directions.
+    """
+    sent = Message.objects.filter(sender=user, receiver=other_user, **filters).select_related(*related).order_by()
+    if user == other_user:
+        return sent
+    received = Message.objects.filter(sender=other_user, receiver=user, **filters).select_related(*related).order_by()
+    return sent.union(received, all=True)
+
+
+def version(user, other_username):
+    """Version stamp of ``user``'s thread with ``other_username``; changes with every message and read receipt."""
+    partner_read = Conversation.objects.filter(owner=OuterRef('partner'), partner=OuterRef('owner')).values(
+        'last_read_message_id'
+    )
+    row = Conversation.objects.filter(owner=user, partner__username=other_username).values_list(
+        'last_message_id', Subquery(partner_read)
+    ).first()
+    last_message_id, partner_read_id = row or (None, None)
+    return f'{last_message_id or 0}.{partner_read_id or 0}'
+
+
+def mark_read(owner, partner, up_to):
+    """
+    Record that ``owner`` has seen the thread with ``partner`` up to message id
+    ``up_to``. Returns whether the watermark moved.
+    """
+    if owner == partner:
+        unread_count = Value(0)
+    else:
+        unread = Message.objects.filter(sender=partner, receiver=owner, id__gt=up_to).order_by().values(
+            'receiver'
+        ).annotate(n=Count('pk')).values('n')
+        unread_count = Coalesce(Subquery(unread), 0)
+
+    moved = Conversation.objects.filter(
+        Q(last_read_message__isnull=True) | Q(last_read_message__lt=up_to), owner=owner, partner=partner
+    ).update(last_read_message_id=up_to, unread_count=unread_count)
+    if not moved:
+        return False
+    badges.resum_messages(owner.id)
+
+    # Let the partner's open chat stream pick up the read receipt
+    transaction.on_commit(lambda: get_broker().publish(
+        chat_channel(owner.id, partner.id), {'type': 'read', 'reader': owner.username, 'read_up_to': up_to}
+    ))
+    return True
+
+
+def read_up_to(reader, partner):
+    """Id of the last message from ``partner`` that ``reader`` has seen, or ``None``."""
+    return Conversation.objects.filter(owner=reader, partner=partner).values_list(
+        'last_read_message_id', flat=True
+    ).first()
+
+
+@receiver(post_save, sender=Message)
+def update_conversation(sender, instance, created, **kwargs):
+    if created:
+        record_message(instance)
@@ -0,0 +1,244 @@
+"""
+Write-behind buffer for post like/comment counters.
+
+A viral post turns every like into an ``UPDATE`` on the same ``core_post``
+row, and SQLite serializes all of them. Instead, each like or comment adds
+its delta to a per-post key in the ``COUNTER_BUFFER_CACHE`` and a
+background thread writes the accumulated deltas back in one batched
+``UPDATE`` every ``COUNTER_BUFFER_FLUSH_INTERVAL`` seconds, or as soon as
+``COUNTER_BUFFER_FLUSH_SIZE`` counters are dirty. Deltas are added once the
+like or comment commits, so a rolled-back one never reaches the buffer. The
+set of dirty counters lives in the cache too, so whichever process flushes
+next writes every pending delta, including those of a worker that has since
+died. A failed flush puts the deltas back and is retried on the next round;
+requests never flush.
+
+The cache holds data that exists nowhere else until it is flushed, so it must
+not evict: give it its own alias with culling effectively off rather than
+sharing one with sessions and fragments. Keys expire only after
+``KEY_TIMEOUT`` without a change.
+
+Reads call ``apply_pending`` so unflushed deltas are always visible, which
+means users see their own like immediately.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+
+from .models import Post, Like, Comment
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('likes_count', 'comments_count')
+
+# Idle keys are dropped after a day; touched on every change, so a pending delta is never near expiry
+KEY_TIMEOUT = 24 * 3600
+
+DIRTY_KEY = 'counterbuf:dirty'
+DIRTY_LOCK_KEY = 'counterbuf:dirty:lock'
+# A lock whose holder died is released after this many seconds
+DIRTY_LOCK_TIMEOUT = 5
+
+# Sent once counter changes reach the database, with ``deltas={post_id: {field: delta}}``; a flush
+# round sends it even when other processes had already written every delta it looked at
+counters_changed = Signal()
+
+
+def enabled():
+    return getattr(settings, 'COUNTER_BUFFER_ENABLED', True)
+
+
+def _cache():
+    return caches[getattr(settings, 'COUNTER_BUFFER_CACHE', 'default')]
+
+
+def _key(post_id, field):
+    return f'counterbuf:{field}:{post_id}'
+
+
+def _incr(cache, key, delta):
+    """Add ``delta`` to a counter key and return its new value."""
+    try:
+        # incr keeps the key's expiry, so push that out first
+        cache.touch(key, KEY_TIMEOUT)
+        return cache.incr(key, delta)
+    except ValueError:
+        # First delta for this post; another process may race us to create it
+        if cache.add(key, delta, timeout=KEY_TIMEOUT):
+            return delta
+        return cache.incr(key, delta)
+
+
+@contextmanager
+def _dirty_lock(cache):
+    """Serializes changes to the dirty set across processes; ``add`` is atomic in every cache backend."""
+    while not cache.add(DIRTY_LOCK_KEY, 1, timeout=DIRTY_LOCK_TIMEOUT):
+        time.sleep(0.001)
+    try:
+        yield
+    finally:
+        cache.delete(DIRTY_LOCK_KEY)
+
+
+def _mark_dirty(cache, counter):
+    """Add ``(post_id, field)`` to the shared dirty set; returns its size."""
+    with _dirty_lock(cache):
+        dirty = cache.get(DIRTY_KEY, set())
+        dirty.add(counter)
+        cache.set(DIRTY_KEY, dirty, timeout=KEY_TIMEOUT)
+    return len(dirty)
+
+
+class CounterBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._due = threading.Event()
+        self._thread = None
+
+    def add(self, post_id, field, delta):
+        cache = _cache()
+        # A counter leaves the dirty set only once it is back at zero, so only that step needs marking
+        if _incr(cache, _key(post_id, field), delta) != delta:
+            self._start()
+            return
+        due = _mark_dirty(cache, (post_id, field)) >= getattr(settings, 'COUNTER_BUFFER_FLUSH_SIZE', 100)
+        self._start()
+        if due:
+            self._due.set()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='counter-buffer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        interval = getattr(settings, 'COUNTER_BUFFER_FLUSH_INTERVAL', 2.0)
+        while True:
+            self._due.wait(interval)
+            self._due.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing buffered counters failed; retrying in %s s', interval)
+            close_old_connections()
+
+    def pending(self, post_ids):
+        """Unflushed deltas as ``{post_id: {field: delta}}``; posts without any are omitted."""
+        keys = {_key(post_id, field): (post_id, field) for post_id in post_ids for field in FIELDS}
+        pending = {}
+        for key, delta in _cache().get_many(list(keys)).items():
+            if delta:
+                post_id, field = keys[key]
+                pending.setdefault(post_id, {})[field] = delta
+        return pending
+
+    def flush(self):
+        """Write every pending delta back to the database; returns the number of posts updated."""
+        cache = _cache()
+        dirty = cache.get(DIRTY_KEY, set())
+        if not dirty:
+            return 0
+
+        keys = {_key(post_id, field): (post_id, field) for post_id, field in dirty}
+        deltas = {field: {} for field in FIELDS}
+        for key, delta in cache.get_many(list(keys)).items():
+            if delta:
+                post_id, field = keys[key]
+                deltas[field][post_id] = delta
+                # Claim the delta before writing it so a concurrent reader never counts it twice
+                cache.decr(key, delta)
+
+        try:
+            with transaction.atomic():
+                for field, by_post in deltas.items():
+                    if by_post:
+                        Post.objects.filter(pk__in=by_post).update(**{field: F(field) + Case(
+                            *[When(pk=post_id, then=Value(delta)) for post_id, delta in by_post.items()],
+                            default=Value(0),
+                            output_field=IntegerField(),
+                        )})
+        except Exception:
+            # The counters are still in the dirty set, so the next round picks these up again
+            for field, by_post in deltas.items():
+                for post_id, delta in by_post.items():
+                    _incr(cache, _key(post_id, field), delta)
+            raise
+
+        # Keep counters that took new deltas meanwhile; a delta arriving after this check marks its counter again
+        with _dirty_lock(cache):
+            remaining = cache.get(DIRTY_KEY, set())
+            values = cache.get_many([_key(post_id, field) for post_id, field in remaining])
+            remaining = {counter for counter in remaining if values.get(_key(*counter))}
+            cache.set(DIRTY_KEY, remaining, timeout=KEY_TIMEOUT)
+
+        changed = {}
+        for field, by_post in deltas.items():
+            for post_id, delta in by_post.items():
+                changed.setdefault(post_id, {})[field] = delta
+        counters_changed.send(sender=Post, deltas=changed)
+        return len(changed)
+
+
+buffer = CounterBuffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        buffer.flush()
+    except DatabaseError:
+        # The deltas stay in the shared cache, where reads keep merging them
+        pass
+
+
+def record(post_id, field, delta):
+    """Apply a counter change, buffered once the transaction commits when ``COUNTER_BUFFER_ENABLED`` is on."""
+    if enabled():
+        transaction.on_commit(lambda: buffer.add(post_id, field, delta))
+    else:
+        Post.objects.filter(pk=post_id).update(**{field: F(field) + delta})
+        counters_changed.send(sender=Post, deltas={post_id: {field: delta}})
+
+
+def apply_pending(posts):
+    """Add unflushed deltas to the counters of already-loaded posts."""
+    posts = list(posts)
+    if posts and enabled():
+        pending = buffer.pending([post.id for post in posts])
+        for post in posts:
+            for field, delta in pending.get(post.id, {}).items():
+                setattr(post, field, getattr(post, field) + delta)
+    return posts
+
+
+@receiver(post_save, sender=Like)
+def update_post_likes_count(sender, instance, created, **kwargs):
+    if created:
+        record(instance.post_id, 'likes_count', 1)
+
+
+@receiver(post_delete, sender=Like)
+def update_post_likes_count_delete(sender, instance, **kwargs):
+    record(instance.post_id, 'likes_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def update_post_comments_count(sender, instance, created, **kwargs):
+    if created:
+        record(instance.post_id, 'comments_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def update_post_comments_count_delete(sender, instance, **kwargs):
+    record(instance.post_id, 'comments_count', -1)
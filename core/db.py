@@ -0,0 +1,87 @@
+"""
+SQLite connection setup and read-only routing.
+
+Every new SQLite connection gets ``SQLITE_PRAGMAS`` (WAL journaling,
+``synchronous=NORMAL``, memory-mapped reads, a larger page cache and a busy
+timeout), so writers queue behind each other instead of failing with
+``database is locked`` and readers never wait for a writer.
+
+Views wrapped in ``read_only`` send their queries to the
+``READ_REPLICA_ALIAS`` connection, the same database file opened with
+``mode=ro``: SQLite refuses any write on it, and it is never holding a write
+lock that another request's transaction has to wait for. Writes always go to
+``default``, as do reads inside an open transaction on ``default`` (they must
+see its uncommitted rows). Under the test runner the replica is a ``MIRROR``
+of ``default`` and resolves to the same in-memory database; reads then stay on
+``default`` so they see each test's transaction.
+"""
+
+import functools
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+_read_only = ContextVar('read_only', default=False)
+
+
+def replica_alias():
+    """The alias reads in ``read_only`` code use, or ``None`` to stay on ``default``."""
+    alias = getattr(settings, 'READ_REPLICA_ALIAS', None)
+    if alias not in settings.DATABASES:
+        return None
+    if connections[alias].settings_dict['NAME'] == connections[DEFAULT_DB_ALIAS].settings_dict['NAME']:
+        # A test mirror: a second connection would not see the test's transaction
+        return None
+    return alias
+
+
+def read_only(view):
+    """Route the queries a view reads with to the read-only connection."""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = _read_only.set(True)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            _read_only.reset(token)
+
+    return wrapper
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if not _read_only.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return replica_alias() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db == getattr(settings, 'READ_REPLICA_ALIAS', None):
+            return False
+        return None
+
+
+@receiver(connection_created)
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    read_only_file = 'mode=ro' in str(connection.settings_dict['NAME'])
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            if read_only_file and pragma == 'journal_mode':
+                # Can't be changed without write access; the writer sets it for the file
+                continue
+            cursor.execute(f'PRAGMA {pragma} = {value}')
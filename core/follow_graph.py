@@ -0,0 +1,266 @@
+"""
+In-memory follow graph: who follows whom, mutual follows and "people you may know".
+
+Each process keeps both directions of ``core_follow`` as one sorted
+``array('i')`` of user ids per user, so membership is a ``bisect`` and a
+user's adjacency costs four bytes per edge instead of a query. Suggestions
+are two hops out: people followed by the people you follow, ranked by how
+many of them follow each candidate (then by follower count).
+
+The graph is loaded on first use. A process applies its own follows and
+unfollows once they commit, and at most every ``FOLLOW_GRAPH_SYNC_SECONDS``
+reads what every process committed since: ``Follow`` rows past the highest id
+it has seen, and ``FollowRemoval`` rows, which the unfollow writes in its own
+transaction. Those two ids are the graph's version. A removed pair may have
+been followed again since, so removals are checked against ``core_follow``
+before they are applied. Ids are assigned in commit order as long as writes
+are serialized (SQLite's IMMEDIATE transactions); anything missed otherwise
+is repaired by the full reload in the background once the graph is older
+than ``FOLLOW_GRAPH_REFRESH_SECONDS``, as is a process too far behind to
+catch up. Removals are kept for twice that.
+"""
+
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import chain
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Follow, FollowRemoval
+
+# A process more changes behind than this reloads instead
+SYNC_BATCH = 10000
+# Old removals are pruned whenever a removal id is a multiple of this
+PRUNE_EVERY = 1000
+# Pairs per query when checking removed pairs against core_follow
+CHECK_CHUNK = 300
+
+# Two-hop suggestions look through at most this many of the people a user follows
+SUGGESTION_SOURCES = 500
+
+_EMPTY = array('i')
+
+
+def _contains(ids, user_id):
+    position = bisect_left(ids, user_id)
+    return position < len(ids) and ids[position] == user_id
+
+
+class FollowGraph:
+    def __init__(self, edges=()):
+        following, followers = defaultdict(list), defaultdict(list)
+        for follower_id, following_id in edges:
+            following[follower_id].append(following_id)
+            followers[following_id].append(follower_id)
+        self._lock = threading.Lock()
+        self._following = {user_id: array('i', sorted(ids)) for user_id, ids in following.items()}
+        self._followers = {user_id: array('i', sorted(ids)) for user_id, ids in followers.items()}
+
+    def following(self, user_id):
+        """Sorted ids of the users ``user_id`` follows."""
+        return self._following.get(user_id, _EMPTY)
+
+    def followers(self, user_id):
+        """Sorted ids of the users following ``user_id``."""
+        return self._followers.get(user_id, _EMPTY)
+
+    def follower_count(self, user_id):
+        return len(self.followers(user_id))
+
+    def is_following(self, user_id, other_id):
+        return _contains(self.following(user_id), other_id)
+
+    def is_mutual(self, user_id, other_id):
+        return self.is_following(user_id, other_id) and self.is_following(other_id, user_id)
+
+    def add(self, follower_id, following_id):
+        with self._lock:
+            for adjacency, key, value in (
+                (self._following, follower_id, following_id),
+                (self._followers, following_id, follower_id),
+            ):
+                ids = adjacency.setdefault(key, array('i'))
+                if not _contains(ids, value):
+                    insort(ids, value)
+
+    def remove(self, follower_id, following_id):
+        with self._lock:
+            for adjacency, key, value in (
+                (self._following, follower_id, following_id),
+                (self._followers, following_id, follower_id),
+            ):
+                ids = adjacency.get(key)
+                if ids is not None and _contains(ids, value):
+                    del ids[bisect_left(ids, value)]
+                    if not ids:
+                        del adjacency[key]
+
+    def suggestions(self, user_id, limit=10):
+        """``(user_id, mutual_count)`` for people two hops away, most followed-by-your-follows first."""
+        following = self.following(user_id)
+        # Spread the sample over the whole (id-sorted) list rather than taking the oldest accounts
+        sources = following[::max(1, -(-len(following) // SUGGESTION_SOURCES))]
+        counts = Counter(chain.from_iterable(self.following(source) for source in sources))
+        counts.pop(user_id, None)
+        candidates = ((candidate, n) for candidate, n in counts.items() if not _contains(following, candidate))
+        return heapq.nlargest(limit, candidates, key=lambda item: (item[1], self.follower_count(item[0]), -item[0]))
+
+
+_graph = None
+# Highest Follow and FollowRemoval ids applied to _graph
+_added_upto = _removed_upto = 0
+_synced_at = _loaded_at = 0.0
+_reloading = False
+_lock = threading.RLock()
+
+
+def _refresh_seconds():
+    return getattr(settings, 'FOLLOW_GRAPH_REFRESH_SECONDS', 3600)
+
+
+def _load():
+    global _graph, _added_upto, _removed_upto, _synced_at, _loaded_at
+    # Read the version first: changes committed while loading are applied again on top, which is harmless
+    added_upto = Follow.objects.aggregate(upto=Max('pk'))['upto'] or 0
+    removed_upto = FollowRemoval.objects.aggregate(upto=Max('pk'))['upto'] or 0
+    graph = FollowGraph(Follow.objects.values_list('follower_id', 'following_id').iterator(chunk_size=10000))
+    with _lock:
+        _graph, _added_upto, _removed_upto = graph, added_upto, removed_upto
+        _synced_at = _loaded_at = time.monotonic()
+    return graph
+
+
+def _reload():
+    global _reloading
+    try:
+        _load()
+    finally:
+        with _lock:
+            _reloading = False
+
+
+def _reload_in_background():
+    global _reloading
+    with _lock:
+        if _reloading:
+            return
+        _reloading = True
+    # Keep answering from the current graph while the new one loads
+    threading.Thread(target=_reload, name='follow-graph', daemon=True).start()
+
+
+def _existing(pairs):
+    """The ``(follower_id, following_id)`` pairs among ``pairs`` that are in ``core_follow`` now."""
+    pairs = list(pairs)
+    existing = set()
+    for start in range(0, len(pairs), CHECK_CHUNK):
+        condition = Q()
+        for follower_id, following_id in pairs[start:start + CHECK_CHUNK]:
+            condition |= Q(follower_id=follower_id, following_id=following_id)
+        existing.update(Follow.objects.filter(condition).values_list('follower_id', 'following_id'))
+    return existing
+
+
+def _sync(graph):
+    """Apply the follows and unfollows committed by any process since the graph's version."""
+    global _added_upto, _removed_upto, _synced_at
+    _synced_at = time.monotonic()
+    # Removals first: a follow deleted after this read is caught by the next sync
+    removed = list(
+        FollowRemoval.objects.filter(pk__gt=_removed_upto).order_by('pk')
+        .values_list('pk', 'follower_id', 'following_id')[:SYNC_BATCH]
+    )
+    added = list(
+        Follow.objects.filter(pk__gt=_added_upto).order_by('pk')
+        .values_list('pk', 'follower_id', 'following_id')[:SYNC_BATCH]
+    )
+    if len(removed) == SYNC_BATCH or len(added) == SYNC_BATCH:
+        _reload_in_background()
+        return
+    if removed:
+        pairs = {(follower_id, following_id) for _, follower_id, following_id in removed}
+        existing = _existing(pairs)
+        for pair in pairs:
+            (graph.add if pair in existing else graph.remove)(*pair)
+        _removed_upto = removed[-1][0]
+    for _, follower_id, following_id in added:
+        graph.add(follower_id, following_id)
+    if added:
+        _added_upto = added[-1][0]
+
+
+def get_graph():
+    """The process-wide ``FollowGraph``, loaded on first use and kept in step with other processes."""
+    graph = _graph
+    if graph is None:
+        # The first request waits; concurrent ones may load it twice, which is harmless
+        return _load()
+    now = time.monotonic()
+    if now - _loaded_at > _refresh_seconds():
+        _reload_in_background()
+    elif now - _synced_at >= getattr(settings, 'FOLLOW_GRAPH_SYNC_SECONDS', 1.0) and _lock.acquire(blocking=False):
+        # One thread syncs; the others answer from the graph as it is
+        try:
+            if graph is _graph:
+                _sync(graph)
+        finally:
+            _lock.release()
+    return graph
+
+
+def is_following(user_id, other_id):
+    return get_graph().is_following(user_id, other_id)
+
+
+def following_ids(user_id):
+    return set(get_graph().following(user_id))
+
+
+def suggestions(user, limit=10):
+    """Suggested ``User``s for ``user``, each with ``mutual_count`` set, best first."""
+    ranked = get_graph().suggestions(user.id, limit)
+    users = User.objects.select_related('profile').in_bulk([user_id for user_id, _ in ranked])
+    suggested = []
+    for user_id, mutual_count in ranked:
+        if user_id in users:
+            users[user_id].mutual_count = mutual_count
+            suggested.append(users[user_id])
+    return suggested
+
+
+def _apply_on_commit(action, follower_id, following_id):
+    def apply():
+        graph = _graph
+        if graph is not None:
+            (graph.add if action == 'add' else graph.remove)(follower_id, following_id)
+
+    # A rolled-back follow never reaches the graph
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=Follow)
+def follow_added(sender, instance, created, **kwargs):
+    if created:
+        _apply_on_commit('add', instance.follower_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_removed(sender, instance, **kwargs):
+    # In the same transaction as the delete, so other processes see both or neither
+    removal = FollowRemoval.objects.create(follower_id=instance.follower_id, following_id=instance.following_id)
+    if removal.pk % PRUNE_EVERY == 0:
+        FollowRemoval.objects.filter(
+            created_at__lt=timezone.now() - timedelta(seconds=2 * _refresh_seconds())
+        ).delete()
+    _apply_on_commit('remove', instance.follower_id, instance.following_id)
@@ -1,3 +1,5 @@
+import posixpath
+
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
@@ -36,12 +38,22 @@ class UserProfileForm(forms.ModelForm):
         }
 
 
+# Video uploads accepted by PostForm, by extension, with the content type browsers send for them
+VIDEO_TYPES = {
+    '.mp4': 'video/mp4',
+    '.webm': 'video/webm',
+    '.mov': 'video/quicktime',
+    '.ogv': 'video/ogg',
+}
+
+
 class PostForm(forms.ModelForm):
     tags_input = forms.CharField(
         required=False,
         widget=forms.TextInput(attrs={
             'class': 'form-control',
-            'placeholder': 'Enter tags separated by spaces (e.g., #tag1 #tag2)'
+            'placeholder': 'Enter tags separated by spaces (e.g., #tag1 #tag2)',
+            'data-autocomplete': 'on',
         }),
         help_text='Enter hashtags separated by spaces'
     )
@@ -53,7 +65,8 @@ class PostForm(forms.ModelForm):
             'content': forms.Textarea(attrs={
                 'class': 'form-control',
                 'rows': 4,
-                'placeholder': "What's on your mind?"
+                'placeholder': "What's on your mind?",
+                'data-autocomplete': 'on',
             }),
             'image': forms.FileInput(attrs={'class': 'form-control'}),
             'video': forms.FileInput(attrs={'class': 'form-control'}),
@@ -66,6 +79,16 @@ class PostForm(forms.ModelForm):
             self.fields['tags_input'].initial = ' '.join([f"#{tag.name}" for tag in tags])
 
 
+    def clean_video(self):
+        video = self.cleaned_data.get('video')
+        # Only new uploads carry a content type; the stored name keeps the extension, which picks the served type
+        if video and hasattr(video, 'content_type'):
+            extension = posixpath.splitext(video.name)[1].lower()
+            if extension not in VIDEO_TYPES or video.content_type not in VIDEO_TYPES.values():
+                raise forms.ValidationError('Upload an MP4, WebM, MOV or Ogg video.')
+        return video
+
+
 class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
@@ -74,6 +97,7 @@ class CommentForm(forms.ModelForm):
             'content': forms.Textarea(attrs={
                 'class': 'form-control',
                 'rows': 2,
-                'placeholder': 'Write a comment...'
+                'placeholder': 'Write a comment...',
+                'data-autocomplete': 'on',
             }),
         }
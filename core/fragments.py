@@ -0,0 +1,76 @@
+"""
+Version stamps for cached post-card fragments.
+
+Feed, explore, profile and tag pages wrap the viewer-independent parts of
+each post card in ``{% cache ... using="fragments" %}`` keyed by ``post.id``
+and ``post.card_version``. The version joins the post's ``updated_at``
+(moved when it is saved, its tags change or its image renditions land), its
+author's ``UserProfile.updated_at`` (profile saved, username or renditions
+changed) and the post's current like and comment counts, so any of those
+changing simply selects a new fragment and the old one ages out (fragments
+are kept for a day). Every part is read from the database and written in the
+same transaction as the change, so all workers agree on it as soon as the
+change commits. Viewer state (the like button) and relative times stay
+outside the cached fragments.
+
+Fragments have their own cache alias, so they never push out sessions or
+other entries in the default cache, nor are pushed out by them.
+"""
+
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Post, UserProfile
+
+
+def _author_stamps(posts):
+    """``{author id: profile updated_at}``, from already loaded profiles where possible."""
+    stamps = {}
+    for post in posts:
+        if Post.author.is_cached(post) and User.profile.is_cached(post.author):
+            stamps[post.author_id] = post.author.profile.updated_at
+    missing = {post.author_id for post in posts} - set(stamps)
+    if missing:
+        stamps.update(UserProfile.objects.filter(user_id__in=missing).values_list('user_id', 'updated_at'))
+    return stamps
+
+
+def _stamp(at):
+    return f'{at.timestamp():.6f}' if at else '0'
+
+
+def attach_versions(posts):
+    """Set ``post.card_version`` on each post; call after counter_buffer.apply_pending."""
+    posts = list(posts)
+    authors = _author_stamps(posts)
+    for post in posts:
+        post.card_version = (
+            f'{_stamp(post.updated_at)}.{_stamp(authors.get(post.author_id))}'
+            f'.{post.likes_count}.{post.comments_count}'
+        )
+    return posts
+
+
+def bump_post(post_id):
+    """Move the cards of a post changed without ``save()`` (bulk tag links, renditions) to a new version."""
+    Post.objects.filter(pk=post_id).update(updated_at=timezone.now())
+
+
+def bump_author(user_id):
+    """Move the cards of every post by ``user_id`` to a new version."""
+    UserProfile.objects.filter(user_id=user_id).update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def post_tags_changed(sender, instance, action, reverse, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear') and not reverse:
+        bump_post(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields=None, **kwargs):
+    # Logins save only last_login, which no card shows
+    if not created and (update_fields is None or 'username' in update_fields):
+        bump_author(instance.pk)
@@ -0,0 +1,201 @@
+"""
+Full-text search over posts, users and tags.
+
+On SQLite everything searchable lives in one FTS5 table, ``core_searchindex``,
+created by migration 0011: ``title`` holds usernames and tag names, ``body``
+holds post content and bios. Rows are keyed by ``rowid = id * 3 + kind`` so
+an object can be replaced or removed without scanning the index. Results are
+ranked by bm25 (titles weigh more) and paged with a ``(rank, rowid)`` cursor.
+Every match is scored, so a query costs in proportion to how many rows it
+matches: rare words take well under a millisecond, a word found in most posts
+can take a few hundred on a large table (see benchmarks/search_vs_like.py).
+
+Signal receivers keep the index in sync; tags created in bulk by
+``core.tags`` are indexed explicitly because ``bulk_create`` sends no
+signals. ``manage.py rebuild_search_index`` refills it from scratch. Other
+database backends fall back to ``icontains`` filters.
+"""
+
+import re
+
+from django.contrib.auth.models import User
+from django.db import connection, models
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import pagination
+from .models import Post, Tag, UserProfile
+
+TABLE = 'core_searchindex'
+
+# Kind codes are part of the rowid; never renumber them
+KINDS = {'posts': 0, 'users': 1, 'tags': 2}
+
+TOKEN_RE = re.compile(r'\w+')
+MAX_TERMS = 8
+
+# bm25 column weights for (kind, object_id, title, body)
+RANK = f'bm25({TABLE}, 0, 0, 4.0, 1.0)'
+
+# The (rank, rowid) cursor key
+CURSOR_FIELDS = (models.FloatField(), models.IntegerField())
+
+
+def available():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """FTS5 query matching every word of ``query``, the last one as a prefix; ``''`` if there are no words."""
+    terms = TOKEN_RE.findall(query.lower())[:MAX_TERMS]
+    if not terms:
+        return ''
+    # Quoting each term keeps FTS5 operators in user input from being interpreted
+    return ' '.join(f'"{term}"' for term in terms[:-1]) + f' "{terms[-1]}"*'
+
+
+def _rowid(kind, object_id):
+    return object_id * len(KINDS) + KINDS[kind]
+
+
+def _upsert(kind, rows):
+    """Replace the index entries for ``rows`` of ``(object_id, title, body)``."""
+    if not rows or not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(_rowid(kind, pk),) for pk, _, _ in rows])
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, kind, object_id, title, body) VALUES (%s, %s, %s, %s, %s)',
+            [(_rowid(kind, pk), kind, pk, title, body) for pk, title, body in rows],
+        )
+
+
+def _remove(kind, object_id):
+    if available():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [_rowid(kind, object_id)])
+
+
+def index_posts(posts):
+    _upsert('posts', [(post.pk, '', post.content) for post in posts])
+
+
+def index_tags(tags):
+    _upsert('tags', [(tag.pk, tag.name, '') for tag in tags])
+
+
+def index_users(user_ids):
+    rows = User.objects.filter(pk__in=user_ids).values_list('pk', 'username', 'profile__bio')
+    _upsert('users', [(pk, username, bio or '') for pk, username, bio in rows])
+
+
+def rebuild():
+    """Refill the whole index from the source tables; returns the number of rows indexed."""
+    if not available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        cursor.execute(
+            f"INSERT INTO {TABLE} (rowid, kind, object_id, title, body) "
+            f"SELECT id * 3 + 0, 'posts', id, '', content FROM core_post"
+        )
+        cursor.execute(
+            f"INSERT INTO {TABLE} (rowid, kind, object_id, title, body) "
+            f"SELECT u.id * 3 + 1, 'users', u.id, u.username, COALESCE(p.bio, '') "
+            f"FROM auth_user u LEFT JOIN core_userprofile p ON p.user_id = u.id"
+        )
+        cursor.execute(
+            f"INSERT INTO {TABLE} (rowid, kind, object_id, title, body) "
+            f"SELECT id * 3 + 2, 'tags', id, name, '' FROM core_tag"
+        )
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {TABLE}')
+        return cursor.fetchone()[0]
+
+
+def _ranked_ids(match, kind, key, reverse, limit):
+    """``(rank, rowid, object_id)`` rows for one kind, ordered by rank and seeking past ``key``."""
+    operator, order = ('<', 'DESC') if reverse else ('>', 'ASC')
+    # Kind and object id are read off the rowid: the UNINDEXED columns would load every match's stored row
+    sql = (
+        f'SELECT {RANK}, rowid, rowid / {len(KINDS)} FROM {TABLE} '
+        f'WHERE {TABLE} MATCH %s AND rowid %% {len(KINDS)} = %s'
+    )
+    params = [match, KINDS[kind]]
+    if key is not None:
+        sql += f' AND ({RANK}, rowid) {operator} (%s, %s)'
+        params += list(key)
+    sql += f' ORDER BY 1 {order}, 2 {order} LIMIT %s'
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _querysets():
+    return {
+        'posts': Post.objects.select_related('author', 'author__profile').prefetch_related('tags'),
+        'users': User.objects.select_related('profile'),
+        'tags': Tag.objects.all(),
+    }
+
+
+def _fallback(query, kind, cursor, per_page):
+    words = TOKEN_RE.findall(query)[:MAX_TERMS]
+    field = {'posts': 'content', 'users': 'username', 'tags': 'name'}[kind]
+    condition = Q()
+    for word in words:
+        condition &= Q(**{f'{field}__icontains': word})
+    return pagination.CursorPaginator(_querysets()[kind].filter(condition), ('-id',), per_page).get_page(cursor)
+
+
+def search(query, kind='posts', cursor=None, per_page=20):
+    """A ``CursorPage`` of the best matches of ``kind`` (``'posts'``, ``'users'`` or ``'tags'``)."""
+    match = match_expression(query)
+    if not match:
+        return pagination.CursorPage([])
+    if not available():
+        return _fallback(query, kind, cursor, per_page)
+
+    direction, key = pagination.decode_cursor(cursor, CURSOR_FIELDS)
+    rows = _ranked_ids(match, kind, key, direction == 'prev', per_page + 1)
+    page = pagination.page_from_rows(rows, per_page, direction, lambda row: (row[0], row[1]))
+
+    objects = _querysets()[kind].in_bulk([object_id for _, _, object_id in page.object_list])
+    page.object_list = [objects[object_id] for _, _, object_id in page.object_list if object_id in objects]
+    return page
+
+
+@receiver(post_save, sender=Post)
+def index_post_on_save(sender, instance, **kwargs):
+    index_posts([instance])
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_on_delete(sender, instance, **kwargs):
+    _remove('posts', instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=UserProfile)
+def index_user_on_save(sender, instance, update_fields=None, **kwargs):
+    # Logins save only last_login; don't rewrite the index entry for that
+    if update_fields is not None and not {'username', 'bio'} & set(update_fields):
+        return
+    index_users([instance.pk if sender is User else instance.user_id])
+
+
+@receiver(post_delete, sender=User)
+def remove_user_on_delete(sender, instance, **kwargs):
+    _remove('users', instance.pk)
+
+
+@receiver(post_save, sender=Tag)
+def index_tag_on_save(sender, instance, **kwargs):
+    index_tags([instance])
+
+
+@receiver(post_delete, sender=Tag)
+def remove_tag_on_delete(sender, instance, **kwargs):
+    _remove('tags', instance.pk)
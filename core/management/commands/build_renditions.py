@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import media
+
+
+def _process(kind, pk, force):
+    try:
+        return media.process(kind, pk, force)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Build missing resized renditions of post images and profile pictures'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=sorted(media.SOURCES), help='Only process post images or profile pictures')
+        parser.add_argument('--force', action='store_true', help='Rebuild renditions that already exist (e.g. after changing widths)')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        kinds = [options['kind']] if options['kind'] else sorted(media.SOURCES)
+        batch_size = options['batch_size']
+        force = options['force']
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for kind in kinds:
+                model, field, target = media.SOURCES[kind]
+
+                built = checked = 0
+                last_pk = 0
+                while True:
+                    batch = list(
+                        model.objects.filter(pk__gt=last_pk).exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                        .order_by('pk').only('pk', field, target)[:batch_size]
+                    )
+                    if not batch:
+                        break
+                    last_pk = batch[-1].pk
+                    checked += len(batch)
+
+                    pending = [obj.pk for obj in batch if media.needs_renditions(kind, obj, force)]
+                    built += sum(executor.map(lambda pk: _process(kind, pk, force), pending))
+
+                self.stdout.write(self.style.SUCCESS(f'{kind}: built renditions for {built} of {checked} images'))
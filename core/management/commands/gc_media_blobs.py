@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core import blobs
+
+
+class Command(BaseCommand):
+    help = 'Delete content-addressed media blobs that no post or profile refers to any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help='Keep blobs unreferenced for less than this long (uploads still being saved)')
+        parser.add_argument('--recount', action='store_true',
+                            help='Recompute reference counts from posts and profiles first')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted without deleting it')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        if options['recount']:
+            corrected = blobs.recount(dry_run=dry_run)
+            self.stdout.write(f'Reference counts off for {corrected} blobs' + (' [not fixed]' if dry_run else ' [fixed]'))
+
+        deleted, freed = blobs.collect(timedelta(hours=options['grace_hours']), dry_run=dry_run)
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {deleted} blobs ({freed / 1024 / 1024:.1f} MiB)'))
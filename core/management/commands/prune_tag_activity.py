@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.tags import prune_activity
+
+
+class Command(BaseCommand):
+    help = 'Delete hourly tag activity buckets older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Keep this many days (default: TAG_ACTIVITY_RETENTION_DAYS)')
+
+    def handle(self, *args, **options):
+        keep = timedelta(days=options['days']) if options['days'] else None
+        deleted = prune_activity(keep)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} tag activity bucket(s)'))
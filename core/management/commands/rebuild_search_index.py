@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import fulltext
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of posts, users and tags from scratch'
+
+    def handle(self, *args, **options):
+        if not fulltext.available():
+            self.stdout.write(self.style.WARNING('Full-text index needs SQLite FTS5; searches use icontains on this database'))
+            return
+        indexed = fulltext.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} posts, users and tags'))
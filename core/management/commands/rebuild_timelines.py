@@ -0,0 +1,23 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from core import timeline
+
+
+class Command(BaseCommand):
+    help = 'Rebuild materialized home timelines from posts and follow relationships'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Only rebuild these users (default: everyone)')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+
+        rebuilt = 0
+        for user in users.iterator():
+            timeline.rebuild(user)
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} timeline(s)'))
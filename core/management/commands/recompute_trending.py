@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import trending
+
+
+class Command(BaseCommand):
+    help = 'Rebuild time-decayed trending scores for posts in the trending window and drop expired ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        scored, pruned = trending.recompute(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Scored {scored} post(s), dropped {pruned} expired score(s)'))
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from core import counter_buffer
+from core.models import Post, Like, Comment, Follow, UserProfile, Tag, Notification, Conversation
+
+
+def _counts(queryset, group_by, ids, aggregate):
+    """Actual totals per ``group_by`` value, limited to ``ids``."""
+    rows = queryset.filter(**{f'{group_by}__in': ids}).values(group_by).annotate(n=aggregate).values_list(group_by, 'n')
+    return dict(rows)
+
+
+# (model, counter field, key on the model used by the counted rows, counted queryset, column the rows group by, aggregate)
+COUNTERS = [
+    (Post, 'likes_count', 'pk', Like.objects.all(), 'post_id', Count('pk')),
+    (Post, 'comments_count', 'pk', Comment.objects.all(), 'post_id', Count('pk')),
+    (UserProfile, 'followers_count', 'user_id', Follow.objects.all(), 'following_id', Count('pk')),
+    (UserProfile, 'following_count', 'user_id', Follow.objects.all(), 'follower_id', Count('pk')),
+    (UserProfile, 'posts_count', 'user_id', Post.objects.all(), 'author_id', Count('pk')),
+    (UserProfile, 'unread_notifications_count', 'user_id', Notification.objects.filter(is_read=False), 'user_id', Count('pk')),
+    (UserProfile, 'unread_messages_count', 'user_id', Conversation.objects.all(), 'owner_id', Sum('unread_count')),
+    (Tag, 'usage_count', 'pk', Post.tags.through.objects.all(), 'tag_id', Count('pk')),
+]
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized like, comment, follow, post, tag and unread badge counters and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        for model, field, key, counted, group_by, aggregate in COUNTERS:
+            checked = drifted = total_drift = 0
+            last_pk = 0
+            while True:
+                # Count and correct each chunk in one transaction, so nothing committed in between is counted twice
+                with transaction.atomic():
+                    batch = list(
+                        model.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', key, field)[:batch_size]
+                    )
+                    if not batch:
+                        break
+                    last_pk = batch[-1].pk
+
+                    actual = _counts(counted, group_by, [getattr(obj, key) for obj in batch], aggregate)
+                    # Deltas still sitting in the write-behind buffer will land later; leave room for them
+                    pending = counter_buffer.buffer.pending([obj.pk for obj in batch]) if model is Post else {}
+                    corrections = []
+                    for obj in batch:
+                        buffered = pending.get(obj.pk, {}).get(field, 0)
+                        delta = actual.get(getattr(obj, key), 0) - getattr(obj, field) - buffered
+                        if delta:
+                            total_drift += abs(delta)
+                            corrections.append((obj.pk, delta))
+                    checked += len(batch)
+                    drifted += len(corrections)
+
+                    if not dry_run:
+                        # Apply the correction as a delta so buffered increments that land later are kept
+                        for pk, delta in corrections:
+                            model.objects.filter(pk=pk).update(**{field: F(field) + delta})
+
+            label = f'{model.__name__}.{field}'
+            summary = f'{label}: {checked} checked, {drifted} drifted (total drift {total_drift})'
+            if drifted:
+                self.stdout.write(self.style.WARNING(summary + (' [not fixed]' if dry_run else ' [fixed]')))
+            else:
+                self.stdout.write(self.style.SUCCESS(summary))
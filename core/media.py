@@ -0,0 +1,242 @@
+"""
+Responsive renditions of uploaded images.
+
+Originals are re-encoded on the way in without their EXIF and XMP (camera,
+GPS), keeping only the orientation tag; JPEGs keep their quantization tables,
+so the pixels barely change. Once a post image or profile picture is
+committed, a thread pool decodes it with Pillow, applies the EXIF
+orientation and writes WebP and JPEG copies at each of
+``MEDIA_RENDITION_WIDTHS`` (never wider than the original) under
+``renditions/``. The copies carry no EXIF at all. The result is stored on the
+model as JSON::
+
+    {"source": "posts/cat.jpg", "width": 3024, "height": 4032,
+     "webp": [{"width": 320, "name": "renditions/posts/cat-320.webp"}, ...],
+     "jpeg": [...]}
+
+and rendered with ``{% responsive_image %}`` from ``core.templatetags.media``,
+which falls back to the original until the renditions exist. Renditions are
+only written if ``source`` is still the model's image, so a replaced upload
+never gets its predecessor's copies. ``manage.py build_renditions`` fills in
+anything the pool missed (e.g. existing media, or jobs lost on restart). Set
+``MEDIA_PIPELINE_ASYNC = False`` (e.g. in tests) to process uploads inline.
+"""
+
+import io
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Post, UserProfile
+
+logger = logging.getLogger(__name__)
+
+# kind: (model, image field, renditions field)
+SOURCES = {
+    'post': (Post, 'image', 'image_renditions'),
+    'profile': (UserProfile, 'profile_picture', 'picture_renditions'),
+}
+
+DEFAULT_WIDTHS = {
+    'post': (320, 640, 1080),
+    'profile': (64, 150, 320),
+}
+
+# The one EXIF tag kept on originals: how to rotate the pixels for display
+ORIENTATION = 0x0112
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def widths(kind):
+    return getattr(settings, 'MEDIA_RENDITION_WIDTHS', DEFAULT_WIDTHS)[kind]
+
+
+def is_current(image, renditions):
+    return bool(image) and (renditions or {}).get('source') == image.name
+
+
+def needs_renditions(kind, obj, force=False):
+    model, field, target = SOURCES[kind]
+    image = getattr(obj, field)
+    # The shared placeholder every new profile starts with is not an upload
+    if not image or image.name == model._meta.get_field(field).default:
+        return False
+    return force or not is_current(image, getattr(obj, target))
+
+
+def _names(renditions):
+    return {entry['name'] for fmt in FORMATS for entry in (renditions or {}).get(fmt, ())}
+
+
+def _flatten(image):
+    """RGB copy of ``image`` with any transparency composited onto white."""
+    if image.mode == 'RGB':
+        return image
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def strip_metadata(upload):
+    """
+    A re-encoded copy of the uploaded image ``upload`` without EXIF or XMP
+    metadata, or ``None`` if it carries none.
+    """
+    upload.seek(0)
+    with Image.open(upload) as image:
+        exif = image.getexif()
+        if not exif and 'xmp' not in image.info:
+            return None
+        pil_format = image.format
+        # Pillow only writes the metadata it is given, so leaving out exif= and xmp= drops it
+        options = {'icc_profile': image.info.get('icc_profile')}
+        if pil_format == 'JPEG':
+            options['quality'] = 'keep'
+            if exif.get(ORIENTATION, 1) != 1:
+                orientation = Image.Exif()
+                orientation[ORIENTATION] = exif[ORIENTATION]
+                options['exif'] = orientation.tobytes()
+        elif getattr(image, 'is_animated', False):
+            options['save_all'] = True
+        else:
+            image = ImageOps.exif_transpose(image)
+        buffer = io.BytesIO()
+        image.save(buffer, pil_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def render(image_file, target_widths):
+    """Write the renditions of ``image_file`` to the default storage and return their description."""
+    # Not the image's own storage: uploads are shared, deduplicated blobs, and each object owns its renditions
+    storage = default_storage
+    stem, _ = posixpath.splitext(image_file.name)
+    with image_file.open('rb'), Image.open(image_file) as original:
+        # Orientation lives in EXIF, which the copies drop; bake it into the pixels first
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        icc_profile = original.info.get('icc_profile')
+
+    renditions = {'source': image_file.name, 'width': image.width, 'height': image.height}
+    sizes = sorted({w for w in target_widths if w < image.width} | {min(image.width, max(target_widths))})
+    for fmt in FORMATS:
+        renditions[fmt] = []
+    try:
+        for width in sizes:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            for fmt, (pil_format, options) in FORMATS.items():
+                buffer = io.BytesIO()
+                frame = resized if fmt == 'webp' else _flatten(resized)
+                # No exif= argument: the copies are written without metadata
+                frame.save(buffer, pil_format, icc_profile=icc_profile, **options)
+                name = storage.save(f'renditions/{stem}-{width}.{fmt}', ContentFile(buffer.getvalue()))
+                renditions[fmt].append({'width': width, 'name': name})
+    except BaseException:
+        # Nothing will ever refer to the copies written so far
+        for name in _names(renditions):
+            storage.delete(name)
+        raise
+    return renditions
+
+
+def process(kind, pk, force=False):
+    """Build renditions for one object if its current image has none (or ``force``); returns whether anything was written."""
+    model, field, target = SOURCES[kind]
+    obj = model.objects.filter(pk=pk).only('pk', field, target).first()
+    if obj is None:
+        return False
+    if not needs_renditions(kind, obj, force):
+        return False
+    image, previous = getattr(obj, field), getattr(obj, target)
+
+    try:
+        renditions = render(image, widths(kind))
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        # Recorded as done without copies so templates keep the original and the backfill skips it
+        logger.warning('Could not build renditions of %s: %s', image.name, exc)
+        renditions = {'source': image.name}
+
+    # Moving updated_at gives cached post cards, which still point at the original, a new version
+    written = model.objects.filter(pk=pk, **{field: image.name}).update(
+        **{target: renditions, 'updated_at': timezone.now()}
+    )
+    # Whichever set lost (the replaced one, or ours if the image changed meanwhile) is garbage now
+    for name in (_names(previous) - _names(renditions)) if written else _names(renditions):
+        default_storage.delete(name)
+    return bool(written)
+
+
+def _run(kind, pk):
+    try:
+        process(kind, pk)
+    except Exception:
+        logger.exception('Building %s renditions for %s failed', kind, pk)
+    finally:
+        close_old_connections()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'MEDIA_PIPELINE_WORKERS', 2), thread_name_prefix='media'
+            )
+        return _executor
+
+
+def schedule(kind, pk):
+    """Build renditions for ``pk`` once the current transaction commits."""
+    if not getattr(settings, 'MEDIA_PIPELINE_ASYNC', True):
+        transaction.on_commit(lambda: process(kind, pk))
+        return
+    transaction.on_commit(lambda: get_executor().submit(_run, kind, pk))
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=UserProfile)
+def strip_upload_metadata(sender, instance, **kwargs):
+    _, field, _ = SOURCES['post' if sender is Post else 'profile']
+    upload = getattr(instance, field)
+    # Only a new upload, before the storage writes it
+    if not upload or upload._committed:
+        return
+    try:
+        stripped = strip_metadata(upload)
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        logger.warning('Could not strip metadata from %s: %s', upload.name, exc)
+        return
+    if stripped is not None:
+        stripped.name = upload.name
+        setattr(instance, field, stripped)
+
+
+@receiver(post_save, sender=Post)
+def schedule_post_image(sender, instance, **kwargs):
+    if needs_renditions('post', instance):
+        schedule('post', instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+def schedule_profile_picture(sender, instance, **kwargs):
+    if needs_renditions('profile', instance):
+        schedule('profile', instance.pk)
@@ -0,0 +1,59 @@
+# Generated by Django 6.0.1 on 2026-10-18 06:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def backfill_timelines(apps, schema_editor):
+    Post = apps.get_model('core', 'Post')
+    Follow = apps.get_model('core', 'Follow')
+    TimelineEntry = apps.get_model('core', 'TimelineEntry')
+    UserProfile = apps.get_model('core', 'UserProfile')
+
+    # Authors above the threshold are pulled at read time, as core.timeline does for new posts
+    threshold = getattr(settings, 'TIMELINE_FANOUT_THRESHOLD', 5000)
+    pulled = set(UserProfile.objects.filter(followers_count__gt=threshold).values_list('user_id', flat=True))
+
+    followers = {}
+    for follower_id, following_id in Follow.objects.values_list('follower_id', 'following_id').iterator(chunk_size=BATCH_SIZE):
+        if following_id not in pulled:
+            followers.setdefault(following_id, []).append(follower_id)
+
+    # Written a batch at a time rather than collecting every post x reader row first
+    entries = []
+    for post_id, author_id, created_at in Post.objects.values_list('id', 'author_id', 'created_at').iterator(chunk_size=BATCH_SIZE):
+        for reader_id in [author_id] + followers.get(author_id, []):
+            entries.append(TimelineEntry(user_id=reader_id, post_id=post_id, author_id=author_id, created_at=created_at))
+            if len(entries) >= BATCH_SIZE:
+                TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+                entries = []
+    TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_message'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='core.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_at', '-post'], name='timeline_user_recent_idx'), models.Index(fields=['user', 'author'], name='timeline_user_author_idx')],
+                'unique_together': {('user', 'post')},
+            },
+        ),
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
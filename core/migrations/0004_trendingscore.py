@@ -0,0 +1,61 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:05
+
+import django.db.models.deletion
+import math
+from datetime import datetime, timedelta, timezone
+
+from django.db import migrations, models
+
+
+def seed_trending_scores(apps, schema_editor):
+    # Same formula as core.trending.score_post with the default settings;
+    # `manage.py recompute_trending` rebuilds these with the configured ones.
+    Post = apps.get_model('core', 'Post')
+    Like = apps.get_model('core', 'Like')
+    Comment = apps.get_model('core', 'Comment')
+    TrendingScore = apps.get_model('core', 'TrendingScore')
+
+    epoch = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    half_life = timedelta(hours=24)
+    since = datetime.now(timezone.utc) - timedelta(days=7)
+
+    def contribution(weight, at):
+        return math.log2(weight) + (at - epoch) / half_life
+
+    def add(a, b):
+        high, low = max(a, b), min(a, b)
+        return high + math.log2(1 + 2 ** (low - high))
+
+    scores = {}
+    for pk, created_at in Post.objects.filter(created_at__gte=since).values_list('pk', 'created_at'):
+        scores[pk] = [contribution(1.0, created_at), created_at]
+    for model, weight in ((Like, 1.0), (Comment, 2.0)):
+        for post_id, at in model.objects.filter(post_id__in=list(scores)).values_list('post_id', 'created_at'):
+            scores[post_id][0] = add(scores[post_id][0], contribution(weight, at))
+
+    TrendingScore.objects.bulk_create(
+        [TrendingScore(post_id=pk, score=score, created_at=created_at) for pk, (score, created_at) in scores.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='core.post')),
+                ('score', models.FloatField()),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score', '-post'], name='trending_score_idx'), models.Index(fields=['created_at'], name='trending_created_idx')],
+            },
+        ),
+        migrations.RunPython(seed_trending_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_trendingscore'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='core.tag')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket'], name='tag_activity_bucket_idx')],
+                'unique_together': {('tag', 'bucket')},
+            },
+        ),
+    ]
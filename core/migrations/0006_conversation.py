@@ -0,0 +1,70 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def backfill_conversations(apps, schema_editor):
+    Message = apps.get_model('core', 'Message')
+    Conversation = apps.get_model('core', 'Conversation')
+
+    last_ids = {}
+    for sender_id, receiver_id, last_id in Message.objects.values('sender_id', 'receiver_id').annotate(
+        last_id=Max('id')
+    ).values_list('sender_id', 'receiver_id', 'last_id'):
+        for pair in ((sender_id, receiver_id), (receiver_id, sender_id)):
+            last_ids[pair] = max(last_ids.get(pair, 0), last_id)
+
+    unread = {
+        (receiver_id, sender_id): count
+        for sender_id, receiver_id, count in Message.objects.filter(is_read=False).values(
+            'sender_id', 'receiver_id'
+        ).annotate(count=Count('id')).values_list('sender_id', 'receiver_id', 'count')
+        if sender_id != receiver_id
+    }
+
+    last_messages = Message.objects.in_bulk(set(last_ids.values()))
+    Conversation.objects.bulk_create(
+        [
+            Conversation(
+                owner_id=owner_id,
+                partner_id=partner_id,
+                last_message_id=message_id,
+                last_message_preview=last_messages[message_id].content[:200],
+                last_message_at=last_messages[message_id].created_at,
+                unread_count=unread.get((owner_id, partner_id), 0),
+            )
+            for (owner_id, partner_id), message_id in last_ids.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_tagactivity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_preview', models.CharField(blank=True, max_length=200)),
+                ('last_message_at', models.DateTimeField()),
+                ('unread_count', models.IntegerField(default=0)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.message')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to=settings.AUTH_USER_MODEL)),
+                ('partner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', '-last_message_at', '-id'], name='conversation_inbox_idx')],
+                'unique_together': {('owner', 'partner')},
+            },
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 6.0.1 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def flags_to_watermarks(apps, schema_editor):
+    Message = apps.get_model('core', 'Message')
+    Conversation = apps.get_model('core', 'Conversation')
+
+    # Having read a message means having seen everything before it in the thread
+    watermarks = {
+        (receiver_id, sender_id): last_id
+        for sender_id, receiver_id, last_id in Message.objects.filter(is_read=True).values(
+            'sender_id', 'receiver_id'
+        ).annotate(last_id=Max('id')).values_list('sender_id', 'receiver_id', 'last_id')
+    }
+
+    conversations = list(Conversation.objects.all())
+    for conversation in conversations:
+        watermark = watermarks.get((conversation.owner_id, conversation.partner_id))
+        conversation.last_read_message_id = watermark
+        if conversation.owner_id == conversation.partner_id:
+            conversation.unread_count = 0
+        else:
+            conversation.unread_count = Message.objects.filter(
+                sender_id=conversation.partner_id, receiver_id=conversation.owner_id, id__gt=watermark or 0
+            ).aggregate(n=Count('id'))['n']
+    Conversation.objects.bulk_update(conversations, ['last_read_message', 'unread_count'], batch_size=500)
+
+
+def watermarks_to_flags(apps, schema_editor):
+    Message = apps.get_model('core', 'Message')
+    Conversation = apps.get_model('core', 'Conversation')
+
+    for owner_id, partner_id, watermark in Conversation.objects.filter(last_read_message__isnull=False).values_list(
+        'owner_id', 'partner_id', 'last_read_message_id'
+    ):
+        Message.objects.filter(sender_id=partner_id, receiver_id=owner_id, id__lte=watermark).update(is_read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_conversation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_read_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.message'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['receiver', 'sender', 'id'], name='message_thread_idx'),
+        ),
+        migrations.RunPython(flags_to_watermarks, watermarks_to_flags),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 6.0.1 on 2026-10-18 10:05
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_actors(apps, schema_editor):
+    Notification = apps.get_model('core', 'Notification')
+    Like = apps.get_model('core', 'Like')
+
+    notifications = list(Notification.objects.select_related('comment'))
+    for notification in notifications:
+        notification.updated_at = notification.created_at
+        if notification.notification_type == 'follow':
+            actor_id = notification.follower_id
+        elif notification.notification_type == 'comment':
+            actor_id = notification.comment.user_id if notification.comment else None
+        else:
+            # Like notifications never stored the liker; take the like written just before them
+            actor_id = Like.objects.filter(
+                post_id=notification.post_id, created_at__lte=notification.created_at
+            ).order_by('-created_at').values_list('user_id', flat=True).first()
+        notification.recent_actor_ids = [actor_id] if actor_id else []
+    Notification.objects.bulk_update(notifications, ['updated_at', 'recent_actor_ids'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_conversation_read_watermark'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='notification',
+            options={'ordering': ['-updated_at']},
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='actor_count',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='recent_actor_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-updated_at'], name='notification_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'notification_type', 'post', '-created_at'], name='notification_group_idx'),
+        ),
+        migrations.RunPython(backfill_actors, migrations.RunPython.noop),
+    ]
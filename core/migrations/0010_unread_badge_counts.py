@@ -0,0 +1,44 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:40
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_badges(apps, schema_editor):
+    UserProfile = apps.get_model('core', 'UserProfile')
+    Notification = apps.get_model('core', 'Notification')
+    Conversation = apps.get_model('core', 'Conversation')
+
+    notifications = dict(
+        Notification.objects.filter(is_read=False).values('user_id').annotate(n=Count('id')).values_list('user_id', 'n')
+    )
+    messages = dict(
+        Conversation.objects.values('owner_id').annotate(n=Sum('unread_count')).values_list('owner_id', 'n')
+    )
+    profiles = list(UserProfile.objects.filter(user_id__in=set(notifications) | set(messages)))
+    for profile in profiles:
+        profile.unread_notifications_count = notifications.get(profile.user_id, 0)
+        profile.unread_messages_count = messages.get(profile.user_id) or 0
+    UserProfile.objects.bulk_update(profiles, ['unread_notifications_count', 'unread_messages_count'], batch_size=500)
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_pendingnotification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='unread_messages_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='unread_notifications_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_badges, migrations.RunPython.noop),
+    ]
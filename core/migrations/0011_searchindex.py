@@ -0,0 +1,44 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:55
+
+from django.db import migrations
+
+TABLE = 'core_searchindex'
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite-only; other backends search with icontains instead (see core.fulltext)
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE {TABLE} USING fts5("
+        f"kind UNINDEXED, object_id UNINDEXED, title, body, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {TABLE} (rowid, kind, object_id, title, body) "
+        f"SELECT id * 3 + 0, 'posts', id, '', content FROM core_post"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {TABLE} (rowid, kind, object_id, title, body) "
+        f"SELECT u.id * 3 + 1, 'users', u.id, u.username, COALESCE(p.bio, '') "
+        f"FROM auth_user u LEFT JOIN core_userprofile p ON p.user_id = u.id"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {TABLE} (rowid, kind, object_id, title, body) "
+        f"SELECT id * 3 + 2, 'tags', id, name, '' FROM core_tag"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_unread_badge_counts'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:40
+
+import core.storage
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('refcount', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to='posts/'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='video',
+            field=models.FileField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to='posts/videos/'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='profile_picture',
+            field=models.ImageField(blank=True, default='profiles/default.png', storage=core.storage.ContentAddressedStorage(), upload_to='profiles/'),
+        ),
+    ]
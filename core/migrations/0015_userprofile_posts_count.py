@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:05
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_posts_count(apps, schema_editor):
+    UserProfile = apps.get_model('core', 'UserProfile')
+    Post = apps.get_model('core', 'Post')
+
+    counts = dict(Post.objects.values('author_id').annotate(n=Count('id')).values_list('author_id', 'n'))
+    profiles = list(UserProfile.objects.filter(user_id__in=counts))
+    for profile in profiles:
+        profile.posts_count = counts[profile.user_id]
+    UserProfile.objects.bulk_update(profiles, ['posts_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='posts_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_posts_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0.1 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_userprofile_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FollowRemoval',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('follower_id', models.IntegerField()),
+                ('following_id', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
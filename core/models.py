@@ -1,18 +1,31 @@
 from django.db import models
+from django.db.models import F
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.text import slugify
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
+from .storage import blob_storage
+
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     bio = models.TextField(max_length=500, blank=True)
-    profile_picture = models.ImageField(upload_to='profiles/', default='profiles/default.png', blank=True)
+    profile_picture = models.ImageField(upload_to='profiles/', storage=blob_storage, default='profiles/default.png', blank=True)
+    # Resized, EXIF-free copies of profile_picture written by core.media
+    picture_renditions = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     followers_count = models.IntegerField(default=0)
     following_count = models.IntegerField(default=0)
+    posts_count = models.IntegerField(default=0)
+    # Nav badges, maintained by core.badges: unread notifications and messages
+    unread_notifications_count = models.IntegerField(default=0)
+    unread_messages_count = models.IntegerField(default=0)
+    # Versions the author's cached post cards; also moved on renames (core.fragments) and new renditions (core.media)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.user.username}'s Profile"
@@ -26,6 +39,11 @@ class Tag(models.Model):
     slug = models.SlugField(max_length=100, unique=True, blank=True)
     usage_count = models.IntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-usage_count'], name='tag_usage_idx'),
+        ]
+
     def __str__(self):
         return f"#{self.name}"
 
@@ -38,8 +56,10 @@ class Tag(models.Model):
 class Post(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
     content = models.TextField(max_length=2200)
-    image = models.ImageField(upload_to='posts/', blank=True, null=True)
-    video = models.FileField(upload_to='posts/videos/', blank=True, null=True)
+    image = models.ImageField(upload_to='posts/', storage=blob_storage, blank=True, null=True)
+    # Resized, EXIF-free copies of image written by core.media
+    image_renditions = models.JSONField(default=dict, blank=True)
+    video = models.FileField(upload_to='posts/videos/', storage=blob_storage, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     likes_count = models.IntegerField(default=0)
@@ -48,6 +68,12 @@ class Post(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Profile grids and timeline backfill: one author's posts, newest first
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_recent_idx'),
+            # Newest posts overall: the default ordering and the trending recompute's window
+            models.Index(fields=['-created_at', '-id'], name='post_recent_idx'),
+        ]
 
     def __str__(self):
         return f"Post by {self.author.username} - {self.created_at}"
@@ -63,6 +89,10 @@ class Like(models.Model):
 
     class Meta:
         unique_together = ['user', 'post']
+        indexes = [
+            # A post's likes by time (trending recompute, notification actors)
+            models.Index(fields=['post', 'created_at'], name='like_post_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} likes {self.post.id}"
@@ -77,6 +107,11 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['post', 'created_at'], name='comment_post_created_idx'),
+            # Whether someone already commented on a post (notification coalescing)
+            models.Index(fields=['user', 'post', 'created_at'], name='comment_user_post_idx'),
+        ]
 
     def __str__(self):
         return f"Comment by {self.user.username} on post {self.post.id}"
@@ -94,7 +129,27 @@ class Follow(models.Model):
         return f"{self.follower.username} follows {self.following.username}"
 
 
+class FollowRemoval(models.Model):
+    """A deleted ``Follow``, kept for a while so every process's follow graph can replay it (see core.follow_graph)."""
+    # Plain ids: the users may be gone too
+    follower_id = models.IntegerField()
+    following_id = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.follower_id} unfollowed {self.following_id}"
+
+
 class Notification(models.Model):
+    """
+    One row per activity rather than per event: repeated likes, comments or
+    follows for the same (user, type, post) within the coalescing window are
+    folded into a single row (see core.notifications). ``follower`` and
+    ``comment`` hold the latest actor's follow/comment; they are cleared,
+    not cascaded, when that one account or comment goes away, since the row
+    also stands for everyone else in ``actor_count``. ``created_at`` is when
+    the first event happened.
+    """
     NOTIFICATION_TYPES = [
         ('like', 'Like'),
         ('comment', 'Comment'),
@@ -104,13 +159,22 @@ class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
     notification_type = models.CharField(max_length=20, choices=NOTIFICATION_TYPES)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, blank=True, null=True, related_name='notifications')
-    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, blank=True, null=True, related_name='notifications')
-    follower = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True, related_name='follower_notifications')
+    comment = models.ForeignKey(Comment, on_delete=models.SET_NULL, blank=True, null=True, related_name='notifications')
+    follower = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='follower_notifications')
+    actor_count = models.IntegerField(default=1)
+    recent_actor_ids = models.JSONField(default=list, blank=True)  # newest first
     is_read = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['user', '-updated_at'], name='notification_inbox_idx'),
+            models.Index(fields=['user', 'notification_type', 'post', '-created_at'], name='notification_group_idx'),
+            # Marking everything read touches only the unread rows
+            models.Index(fields=['user'], condition=models.Q(is_read=False), name='notification_unread_idx'),
+        ]
 
     def __str__(self):
         return f"Notification for {self.user.username} - {self.notification_type}"
@@ -120,58 +184,155 @@ class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
     content = models.TextField(max_length=1000)
-    is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Unread messages are a range past the reader's watermark in Conversation
+            models.Index(fields=['receiver', 'sender', 'id'], name='message_thread_idx'),
+            # One direction of a chat in display order; core.conversations.thread merges the two
+            models.Index(fields=['sender', 'receiver', 'created_at'], name='message_pair_created_idx'),
+        ]
 
     def __str__(self):
         return f"Message from {self.sender.username} to {self.receiver.username}"
 
 
-# Signals to update counts
-@receiver(post_save, sender=Like)
-def update_post_likes_count(sender, instance, created, **kwargs):
-    if created:
-        instance.post.likes_count = instance.post.post_likes.count()
-        instance.post.save(update_fields=['likes_count'])
+class Conversation(models.Model):
+    """
+    Inbox summary of a direct-message thread, one row per participant.
 
+    The pair (owner, partner) has a mirror row (partner, owner); both carry the
+    last message, and each keeps its owner's own unread counter, so an inbox
+    is a single range read over ``(owner, last_message_at)``.
 
-@receiver(post_delete, sender=Like)
-def update_post_likes_count_delete(sender, instance, **kwargs):
-    instance.post.likes_count = instance.post.post_likes.count()
-    instance.post.save(update_fields=['likes_count'])
+    Read state is a watermark: every message from the partner up to
+    ``last_read_message`` counts as read by the owner, and the partner's
+    mirror row gives the owner's read receipts.
+    """
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations')
+    partner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    last_message = models.ForeignKey(Message, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    last_message_preview = models.CharField(max_length=200, blank=True)
+    last_message_at = models.DateTimeField()
+    last_read_message = models.ForeignKey(Message, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    unread_count = models.IntegerField(default=0)
 
+    class Meta:
+        unique_together = ['owner', 'partner']
+        indexes = [
+            models.Index(fields=['owner', '-last_message_at', '-id'], name='conversation_inbox_idx'),
+        ]
 
-@receiver(post_save, sender=Comment)
-def update_post_comments_count(sender, instance, created, **kwargs):
-    if created:
-        instance.post.comments_count = instance.post.post_comments.count()
-        instance.post.save(update_fields=['comments_count'])
+    def __str__(self):
+        return f"{self.owner.username}'s conversation with {self.partner.username}"
 
 
-@receiver(post_delete, sender=Comment)
-def update_post_comments_count_delete(sender, instance, **kwargs):
-    instance.post.comments_count = instance.post.post_comments.count()
-    instance.post.save(update_fields=['comments_count'])
+class TimelineEntry(models.Model):
+    """Materialized home-feed row: one per (reader, post) pushed at write time."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='timeline_user_recent_idx'),
+            models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ]
 
+    def __str__(self):
+        return f"Post {self.post_id} in {self.user.username}'s timeline"
+
+
+class TrendingScore(models.Model):
+    """
+    Time-decayed engagement score for a recent post.
+
+    Stored as log2 of the sum of weights scaled by 2^(t / half-life), so older
+    rows never need rewriting as time passes and ordering by ``score`` is
+    ordering by the current decayed score.
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    score = models.FloatField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', '-post'], name='trending_score_idx'),
+            models.Index(fields=['created_at'], name='trending_created_idx'),
+        ]
 
+    def __str__(self):
+        return f"Trending score for post {self.post_id}"
+
+
+class TagActivity(models.Model):
+    """Number of new posts using a tag within one hour; summed over a few buckets for "trending now"."""
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='activity')
+    bucket = models.DateTimeField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['tag', 'bucket']
+        indexes = [
+            # Covers the trending-tags sum over recent buckets
+            models.Index(fields=['bucket', 'tag', 'count'], name='tag_activity_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.tag.name} x{self.count} at {self.bucket:%Y-%m-%d %H:00}"
+
+
+class PendingNotification(models.Model):
+    """Notification event spilled to the database when the in-process dispatch queue is full or failing."""
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Pending {self.payload.get('action')} {self.payload.get('kind')} for user {self.payload.get('recipient_id')}"
+
+
+class MediaBlob(models.Model):
+    """An upload in content-addressed storage and how many file fields point at it (see core.blobs)."""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} x{self.refcount}"
+
+
+# Signals to update counts
+# Counters are adjusted with F() expressions so concurrent toggles never race
+# or re-count the whole relation; `manage.py reconcile_counters` repairs drift.
+# Post like/comment counters go through the write-behind buffer in core.counter_buffer.
 @receiver(post_save, sender=Follow)
 def update_follow_counts(sender, instance, created, **kwargs):
     if created:
-        instance.follower.profile.following_count = instance.follower.following.count()
-        instance.follower.profile.save(update_fields=['following_count'])
-        instance.following.profile.followers_count = instance.following.followers.count()
-        instance.following.profile.save(update_fields=['followers_count'])
+        UserProfile.objects.filter(user_id=instance.follower_id).update(following_count=F('following_count') + 1)
+        UserProfile.objects.filter(user_id=instance.following_id).update(followers_count=F('followers_count') + 1)
 
 
 @receiver(post_delete, sender=Follow)
 def update_follow_counts_delete(sender, instance, **kwargs):
-    instance.follower.profile.following_count = instance.follower.following.count()
-    instance.follower.profile.save(update_fields=['following_count'])
-    instance.following.profile.followers_count = instance.following.followers.count()
-    instance.following.profile.save(update_fields=['followers_count'])
+    UserProfile.objects.filter(user_id=instance.follower_id).update(following_count=F('following_count') - 1)
+    UserProfile.objects.filter(user_id=instance.following_id).update(followers_count=F('followers_count') - 1)
+
+
+@receiver(post_save, sender=Post)
+def update_posts_count(sender, instance, created, **kwargs):
+    if created:
+        UserProfile.objects.filter(user_id=instance.author_id).update(posts_count=F('posts_count') + 1)
+
+
+@receiver(post_delete, sender=Post)
+def update_posts_count_delete(sender, instance, **kwargs):
+    UserProfile.objects.filter(user_id=instance.author_id).update(posts_count=F('posts_count') - 1)
 
 
 @receiver(post_save, sender=User)
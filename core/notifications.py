@@ -0,0 +1,367 @@
+"""
+Coalesced notifications ("alice, bob and 40 others liked your post").
+
+An event for the same recipient, type and post (follows have no post) is
+folded into the newest unread notification opened within
+``NOTIFICATION_COALESCE_WINDOW_HOURS``, which keeps a running ``actor_count``
+and the ids of the last few actors. Storage and the notifications page scale
+with distinct activities instead of raw events.
+
+Undoing an event (unlike, unfollow) takes it back out of the notification
+that counted it. Groups for one key never overlap in time, so that is the
+oldest one still updated at or after the event; pass the same ``at`` (the
+Like/Follow ``created_at``) to ``notify`` and ``retract``.
+
+Events are written off the request path: ``notify``/``retract`` enqueue them
+on commit to a bounded in-process queue, and a worker thread applies them in
+batches of ``NOTIFICATION_BATCH_SIZE`` with one bulk write per batch. When the
+queue is full, or a batch fails, events are spilled to ``PendingNotification``
+and retried by the worker. Set ``NOTIFICATION_DISPATCH_ASYNC = False`` (e.g. in
+tests) to apply every event inline instead.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import Counter, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DatabaseError, OperationalError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import badges
+from .models import Post, Comment, Notification, PendingNotification
+
+logger = logging.getLogger(__name__)
+
+RECENT_ACTORS = 3
+APPLY_ATTEMPTS = 3
+
+Event = namedtuple('Event', 'action recipient_id kind actor_id post_id comment_id at')
+
+
+def window():
+    return timedelta(hours=getattr(settings, 'NOTIFICATION_COALESCE_WINDOW_HOURS', 24))
+
+
+def _key(event):
+    return (event.recipient_id, event.kind, event.post_id)
+
+
+def _add_actor(notification, event, counted=False):
+    # Someone still in the recent list is already counted too (e.g. a second like after an unlike)
+    if not counted and event.actor_id not in notification.recent_actor_ids:
+        notification.actor_count += 1
+    notification.recent_actor_ids = (
+        [event.actor_id] + [i for i in notification.recent_actor_ids if i != event.actor_id]
+    )[:RECENT_ACTORS]
+    notification.updated_at = max(event.at, notification.updated_at)
+    if event.comment_id is not None:
+        notification.comment_id = event.comment_id
+    if event.kind == 'follow':
+        notification.follower_id = event.actor_id
+
+
+def _remove_actor(notification, event):
+    notification.actor_count -= 1
+    notification.recent_actor_ids = [i for i in notification.recent_actor_ids if i != event.actor_id]
+    if event.kind == 'follow' and notification.follower_id == event.actor_id:
+        notification.follower_id = notification.recent_actor_ids[0] if notification.recent_actor_ids else None
+
+
+def _comment_history(events, since):
+    """Creation times of the comments each commenter in ``events`` left on that post since ``since``."""
+    pairs = {(event.post_id, event.actor_id) for event in events if event.kind == 'comment'}
+    if not pairs:
+        return {}
+    matches_pair = Q()
+    for post_id, user_id in pairs:
+        matches_pair |= Q(post_id=post_id, user_id=user_id)
+    history = {}
+    # Each branch of the OR is a range read on comment_user_post_idx
+    for post_id, user_id, created_at in Comment.objects.filter(matches_pair, created_at__gte=since).order_by().values_list(
+        'post_id', 'user_id', 'created_at'
+    ):
+        history.setdefault((post_id, user_id), []).append(created_at)
+    return history
+
+
+def _commented_before(history, notification, event):
+    """Whether ``event``'s commenter already commented on the post since ``notification`` opened."""
+    return any(
+        notification.created_at <= created_at < event.at
+        for created_at in history.get((event.post_id, event.actor_id), ())
+    )
+
+
+def apply(events):
+    """Apply a batch of events in order with one read and one write per kind of change."""
+    events = [event for event in events if event.recipient_id != event.actor_id]
+    # Posts and comments may be gone by the time a queued event is applied
+    post_ids = set(Post.objects.filter(
+        pk__in={event.post_id for event in events if event.post_id}
+    ).values_list('pk', flat=True))
+    comment_ids = set(Comment.objects.filter(
+        pk__in={event.comment_id for event in events if event.comment_id}
+    ).values_list('pk', flat=True))
+    events = [
+        event._replace(comment_id=event.comment_id if event.comment_id in comment_ids else None)
+        for event in events if event.post_id is None or event.post_id in post_ids
+    ]
+    if not events:
+        return
+
+    keys = {_key(event) for event in events}
+    matches_key = Q()
+    for recipient_id, kind, post_id in keys:
+        matches_key |= Q(user_id=recipient_id, notification_type=kind, post_id=post_id)
+    # Every group an event can join (opened within the window) or retract from (updated since) is this recent
+    since = min(event.at for event in events) - window()
+    comment_history = _comment_history(events, since)
+
+    with transaction.atomic():
+        # Batches applied concurrently (another worker process, a spilled retry) must not interleave between this
+        # read and the write below: lock the rows where the database can, while on SQLite the IMMEDIATE transaction
+        # already holds the write lock from BEGIN
+        groups = {key: [] for key in keys}
+        loaded_counts = {}
+        for notification in Notification.objects.select_for_update().filter(
+            matches_key, updated_at__gte=since
+        ).order_by('created_at'):
+            groups[(notification.user_id, notification.notification_type, notification.post_id)].append(notification)
+            loaded_counts[notification.pk] = notification.actor_count
+
+        # Unsaved notifications are unhashable, so track changes by identity
+        changed, deleted = {}, []
+        for event in events:
+            key = _key(event)
+            if event.action == 'notify':
+                open_groups = [
+                    n for n in groups[key] if not n.is_read and n.created_at >= event.at - window()
+                ]
+                if open_groups:
+                    notification = open_groups[-1]
+                    _add_actor(
+                        notification, event,
+                        counted=event.kind == 'comment' and _commented_before(comment_history, notification, event),
+                    )
+                else:
+                    notification = Notification(
+                        user_id=event.recipient_id,
+                        notification_type=event.kind,
+                        post_id=event.post_id,
+                        comment_id=event.comment_id,
+                        follower_id=event.actor_id if event.kind == 'follow' else None,
+                        recent_actor_ids=[event.actor_id],
+                        created_at=event.at,
+                        updated_at=event.at,
+                    )
+                    groups[key].append(notification)
+                changed[id(notification)] = notification
+            else:
+                counted = [n for n in groups[key] if n.updated_at >= event.at]
+                if not counted:
+                    continue
+                notification = counted[0]
+                if notification.actor_count <= 1:
+                    groups[key].remove(notification)
+                    changed.pop(id(notification), None)
+                    if notification.pk:
+                        deleted.append(notification)
+                else:
+                    _remove_actor(notification, event)
+                    changed[id(notification)] = notification
+
+        created = [n for n in changed.values() if not n.pk]
+        updated = [n for n in changed.values() if n.pk]
+        Notification.objects.bulk_create(created)
+        for notification in updated:
+            # Write the count as a delta, so it stays right even without a row lock
+            notification.actor_count = F('actor_count') + (notification.actor_count - loaded_counts[notification.pk])
+        Notification.objects.bulk_update(
+            updated, ['actor_count', 'recent_actor_ids', 'updated_at', 'comment', 'follower'],
+        )
+
+        # Badges count unread notifications (activities), so only new and deleted rows move them
+        unread = Counter(n.user_id for n in created)
+        unread.subtract(n.user_id for n in deleted if not n.is_read)
+        if deleted:
+            Notification.objects.filter(pk__in=[n.pk for n in deleted]).delete()
+        badges.adjust('notifications', unread)
+
+
+def _encode(event):
+    return event._asdict()
+
+
+def _decode(payload):
+    return Event(**dict(payload, at=parse_datetime(payload['at'])))
+
+
+def _async_enabled():
+    return getattr(settings, 'NOTIFICATION_DISPATCH_ASYNC', True)
+
+
+class Dispatcher:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=getattr(settings, 'NOTIFICATION_QUEUE_SIZE', 10000))
+        self._thread = None
+        self._stopping = threading.Event()
+        # Spilled events from an earlier run are picked up once the worker starts
+        self._spilled = True
+        self.dispatched = 0
+        self.spilled = 0
+        self.lag = 0.0
+
+    def submit(self, event):
+        if not _async_enabled():
+            apply([event])
+            return
+        # Only queue events whose like/follow/comment actually committed
+        transaction.on_commit(lambda: self._enqueue(event))
+
+    def _enqueue(self, event):
+        self._start()
+        try:
+            self._queue.put_nowait((time.monotonic(), event))
+        except queue.Full:
+            self._spill([event])
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='notification-dispatcher', daemon=True)
+                self._thread.start()
+
+    def _spill(self, events):
+        PendingNotification.objects.bulk_create([PendingNotification(payload=_encode(event)) for event in events])
+        self.spilled += len(events)
+        self._spilled = True
+
+    def _take(self, timeout):
+        """Block up to ``timeout`` for the first queued event, then take whatever else is ready."""
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        batch_size = getattr(settings, 'NOTIFICATION_BATCH_SIZE', 100)
+        while len(batch) < batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _apply(self, batch):
+        events = [event for _, event in batch]
+        try:
+            for attempt in range(APPLY_ATTEMPTS):
+                try:
+                    apply(events)
+                    break
+                except OperationalError:
+                    # Usually SQLite refusing a lock upgrade while a request is writing; back off briefly
+                    if attempt == APPLY_ATTEMPTS - 1:
+                        raise
+                    time.sleep(0.05 * (attempt + 1))
+        except Exception:
+            logger.exception('Applying %d notification events failed; spilling them for retry', len(events))
+            try:
+                self._spill(events)
+            except DatabaseError:
+                logger.exception('Spilling notification events failed; %d events lost', len(events))
+            return
+        self.dispatched += len(events)
+        self.lag = time.monotonic() - batch[0][0]
+
+    def _drain_spilled(self):
+        batch_size = getattr(settings, 'NOTIFICATION_BATCH_SIZE', 100)
+        with transaction.atomic():
+            rows = list(PendingNotification.objects.order_by('pk')[:batch_size])
+            if rows:
+                # Claim the rows before applying them: a worker that read some of them too deletes fewer
+                # (or fails to take the write lock) and backs off instead of applying them a second time
+                claimed, _ = PendingNotification.objects.filter(pk__in=[row.pk for row in rows]).delete()
+                if claimed != len(rows):
+                    transaction.set_rollback(True)
+                    return
+                apply([_decode(row.payload) for row in rows])
+        self.dispatched += len(rows)
+        self._spilled = len(rows) == batch_size
+
+    def _run(self):
+        interval = getattr(settings, 'NOTIFICATION_FLUSH_INTERVAL', 1.0)
+        while not self._stopping.is_set():
+            batch = self._take(interval)
+            if batch:
+                self._apply(batch)
+            elif self._spilled:
+                try:
+                    self._drain_spilled()
+                except Exception:
+                    logger.exception('Retrying spilled notification events failed')
+                    self._stopping.wait(interval)
+            close_old_connections()
+
+    def flush(self):
+        """Apply everything still queued in the calling thread; used at shutdown."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        while True:
+            batch = self._take(0)
+            if not batch:
+                break
+            self._apply(batch)
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize(),
+            'queue_size': self._queue.maxsize,
+            'lag_seconds': round(self.lag, 3),
+            'dispatched': self.dispatched,
+            'spilled': self.spilled,
+            'pending_durable': PendingNotification.objects.count(),
+            'worker_alive': self._thread is not None and self._thread.is_alive(),
+        }
+
+
+dispatcher = Dispatcher()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        dispatcher.flush()
+    except DatabaseError:
+        pass
+
+
+def notify(recipient_id, kind, actor_id, post_id=None, comment_id=None, at=None):
+    """Record that ``actor_id`` liked/commented/followed; self-notifications are dropped."""
+    if recipient_id != actor_id:
+        dispatcher.submit(Event('notify', recipient_id, kind, actor_id, post_id, comment_id, at or timezone.now()))
+
+
+def retract(recipient_id, kind, actor_id, post_id=None, at=None):
+    """Undo an event recorded by ``notify`` at ``at``, deleting the notification once nobody is left."""
+    if recipient_id != actor_id:
+        dispatcher.submit(Event('retract', recipient_id, kind, actor_id, post_id, None, at or timezone.now()))
+
+
+def attach_actors(notifications):
+    """Set ``actors`` (recent actors, newest first) and ``other_actors_count`` on each notification."""
+    notifications = list(notifications)
+    users = User.objects.in_bulk({i for notification in notifications for i in notification.recent_actor_ids})
+    for notification in notifications:
+        notification.actors = [users[i] for i in notification.recent_actor_ids if i in users]
+        notification.other_actors_count = max(notification.actor_count - len(notification.actors), 0)
+    return notifications
@@ -0,0 +1,161 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are addressed by the sort key of the row at their edge instead of an
+offset, so every page is a bounded index range read and no ``COUNT(*)`` is
+needed. Cursors are opaque url-safe tokens carrying the direction and key.
+A token is client input: its key is converted with the ordering fields'
+``to_python`` and one that does not fit is read as the first page.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from operator import attrgetter
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return parse_datetime(value['dt'])
+    return value
+
+
+def encode_cursor(direction, key):
+    payload = json.dumps([direction, [_encode_value(value) for value in key]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def key_fields(model, ordering):
+    """The model fields ``ordering`` sorts by (names may follow relations with ``__``), for ``decode_cursor``."""
+    fields = []
+    for name in ordering:
+        *path, last = name.lstrip('-').split('__')
+        opts = model._meta
+        for part in path:
+            opts = opts.get_field(part).related_model._meta
+        fields.append(opts.get_field(last))
+    return fields
+
+
+def decode_cursor(token, fields):
+    """
+    Return ``(direction, key)`` for a cursor token, or ``(None, None)`` if it is missing or malformed.
+
+    ``fields`` are the fields the key sorts by; the key must have one value
+    per field, each of which the field's ``to_python`` accepts.
+    """
+    if not token:
+        return None, None
+    try:
+        payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, key = json.loads(payload)
+        key = tuple(_decode_value(value) for value in key)
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        return None, None
+    if direction not in ('next', 'prev') or None in key or len(key) != len(fields):
+        return None, None
+    try:
+        key = tuple(field.to_python(value) for field, value in zip(fields, key))
+    except (ValidationError, TypeError, ValueError):
+        return None, None
+    return direction, key
+
+
+def seek(queryset, ordering, key=None, reverse=False):
+    """
+    Order ``queryset`` by ``ordering`` and keep only rows after ``key``.
+
+    ``ordering`` is a sequence of field names, prefixed with ``-`` for
+    descending, that must end in a unique field. With ``reverse`` the rows
+    before ``key`` are returned, nearest first.
+    """
+    fields = [(name.lstrip('-'), name.startswith('-') != reverse) for name in ordering]
+    queryset = queryset.order_by(*[('-' if descending else '') + name for name, descending in fields])
+    if key is None:
+        return queryset
+
+    condition = Q()
+    for i, (name, descending) in enumerate(fields):
+        step = Q(**{f'{name}__{"lt" if descending else "gt"}': key[i]})
+        for j in range(i):
+            step &= Q(**{fields[j][0]: key[j]})
+        condition |= step
+    return queryset.filter(condition)
+
+
+class CursorPage:
+    """A page of results with opaque cursors to its neighbours; quacks like ``Paginator.Page`` in templates."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def page_from_rows(rows, per_page, direction, key):
+    """
+    Build a ``CursorPage`` from up to ``per_page + 1`` rows fetched with ``seek``.
+
+    The extra row only tells us whether another page exists in the direction we read.
+    """
+    rows = list(rows)
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'prev':
+        rows.reverse()
+        has_next, has_previous = bool(rows), has_more
+    else:
+        has_next, has_previous = has_more, direction == 'next' and bool(rows)
+
+    return CursorPage(
+        rows,
+        next_cursor=encode_cursor('next', key(rows[-1])) if has_next else None,
+        previous_cursor=encode_cursor('prev', key(rows[0])) if has_previous else None,
+    )
+
+
+class CursorPaginator:
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.fields = key_fields(queryset.model, self.ordering)
+        self._key_getter = attrgetter(*[name.lstrip('-').replace('__', '.') for name in self.ordering])
+
+    def key(self, obj):
+        value = self._key_getter(obj)
+        return value if len(self.ordering) > 1 else (value,)
+
+    def get_page(self, cursor=None):
+        direction, key = decode_cursor(cursor, self.fields)
+        rows = seek(self.queryset, self.ordering, key, reverse=direction == 'prev')[:self.per_page + 1]
+        return page_from_rows(rows, self.per_page, direction, self.key)
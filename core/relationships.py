@@ -0,0 +1,17 @@
+"""
+Follow-relationship checks for gating chat.
+
+Two users may message each other when either follows the other. The answer
+comes from the in-process follow graph (``core.follow_graph``): two
+``bisect`` lookups, no query, and as current as the graph, which picks up a
+follow or unfollow made in any worker within ``FOLLOW_GRAPH_SYNC_SECONDS``.
+"""
+
+from . import follow_graph
+
+
+def can_message(user, other_user):
+    """Users can chat when either follows the other, and always with themselves."""
+    if user.pk == other_user.pk:
+        return True
+    return follow_graph.is_following(user.pk, other_user.pk) or follow_graph.is_following(other_user.pk, user.pk)
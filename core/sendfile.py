@@ -0,0 +1,181 @@
+"""
+Serving uploaded media: byte ranges, conditional requests and proxy handoff.
+
+``serve`` replaces ``django.conf.urls.static``, which reads every file
+through Python and ignores ``Range``, so seeking in a video re-downloads it.
+Here files are answered with ``FileResponse`` so WSGI servers that provide
+``wsgi.file_wrapper`` (gunicorn, uWSGI) can use ``sendfile``; a range that
+runs to the end of the file (what players send when seeking) is the file
+itself opened at the offset, so it gets the same zero-copy path. Bounded
+ranges are streamed through ``RangeFile``. ``ETag``/``Last-Modified`` come
+from ``stat``, so ``If-None-Match``, ``If-Modified-Since`` and ``If-Range``
+are answered without opening the file.
+
+With a front proxy, set ``MEDIA_SENDFILE`` to ``'x-accel-redirect'`` (nginx,
+with an ``internal`` location at ``MEDIA_ACCEL_PREFIX`` aliased to
+``MEDIA_ROOT``) or ``'x-sendfile'`` (Apache mod_xsendfile, lighttpd) and the
+proxy streams the file, ranges included, while Django only resolves the path.
+
+Uploads are untrusted: every response is ``nosniff``, anything but an image
+or video (SVG included, as it can carry script) is sent as an attachment,
+and with ``MEDIA_HOST`` set only requests for that host are answered.
+"""
+
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+from .storage import is_blob
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Content types a browser may render inline
+INLINE_TYPES = ('image/', 'video/')
+SCRIPTABLE_TYPES = {'image/svg+xml'}
+
+
+class RangeFile:
+    """Read-only view of ``length`` bytes of an open file, starting at its current position."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    ``(start, end)`` (inclusive) of a single-range ``Range`` header, ``None`` to
+    serve the whole file, or ``()`` if the range cannot be satisfied.
+
+    Multiple ranges and malformed headers are ignored, as RFC 9110 allows.
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        return (max(size - length, 0), size - 1) if length and size else ()
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return ()
+    return start, end
+
+
+def etag_for(stat):
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def if_range_passes(request, etag, last_modified):
+    """Whether a ``Range`` may be honoured: no ``If-Range``, or one naming the current version."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        # Weak validators never match for ranges
+        return parse_etags(if_range) == [etag]
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _protect(response, content_type):
+    response['X-Content-Type-Options'] = 'nosniff'
+    if not content_type.startswith(INLINE_TYPES) or content_type in SCRIPTABLE_TYPES:
+        response['Content-Disposition'] = 'attachment'
+    return response
+
+
+def _handoff(path, full_path, content_type):
+    mode = getattr(settings, 'MEDIA_SENDFILE', None)
+    response = HttpResponse(content_type=content_type)
+    if mode == 'x-accel-redirect':
+        prefix = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = quote(posixpath.join(prefix, path))
+    else:
+        response['X-Sendfile'] = full_path
+    return response
+
+
+def serve(request, path, document_root=None):
+    """Serve ``path`` from ``document_root`` (``MEDIA_ROOT`` by default)."""
+    media_host = getattr(settings, 'MEDIA_HOST', None)
+    if media_host and request.get_host() != media_host:
+        raise Http404('Not found')
+    try:
+        full_path = safe_join(document_root or settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Not found')
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404('Not found')
+    if not os.path.isfile(full_path):
+        raise Http404('Not found')
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    if getattr(settings, 'MEDIA_SENDFILE', None):
+        # The proxy does its own Range and conditional handling
+        return _protect(_handoff(path, full_path, content_type), content_type)
+
+    etag, last_modified = etag_for(stat), int(stat.st_mtime)
+    validators = HttpResponse()
+    validators['ETag'] = etag
+    validators['Last-Modified'] = http_date(last_modified)
+    if is_blob(path):
+        # Content-addressed: the name changes whenever the bytes do
+        patch_cache_control(validators, public=True, max_age=365 * 24 * 3600, immutable=True)
+    else:
+        patch_cache_control(validators, public=True, max_age=getattr(settings, 'MEDIA_MAX_AGE', 86400))
+    conditional = get_conditional_response(request, etag, last_modified, validators)
+    if conditional is not validators:
+        return conditional
+
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and if_range_passes(request, etag, last_modified):
+        byte_range = parse_range(request.META['HTTP_RANGE'], stat.st_size)
+    if byte_range == ():
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        # Open-ended ranges are the rest of the file, which keeps sendfile usable
+        body = file if end == stat.st_size - 1 else RangeFile(file, end - start + 1)
+        response = FileResponse(body, status=206, content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    for header in ('ETag', 'Last-Modified', 'Cache-Control'):
+        response[header] = validators[header]
+    response['Accept-Ranges'] = 'bytes'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return _protect(response, content_type)
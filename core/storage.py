@@ -0,0 +1,78 @@
+"""
+Content-addressed, deduplicating storage for uploads.
+
+``ContentAddressedStorage`` hashes an upload (SHA-256) while streaming it to
+a temporary file, then moves it to ``blobs/<ab>/<cd>/<hash><ext>``. If that
+blob already exists the copy is discarded and the existing name returned, so
+a reposted meme or a re-uploaded avatar is stored, and cached, once. Blobs
+are immutable: a name always means the same bytes.
+
+Because several rows can point at one blob, blobs must never be deleted
+through the storage directly. ``core.blobs`` reference-counts them across
+``Post.image``, ``Post.video`` and ``UserProfile.profile_picture``, and
+``manage.py gc_media_blobs`` removes the ones nothing refers to.
+"""
+
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_PREFIX = 'blobs'
+TMP_DIR = 'tmp'
+
+EXTENSION_RE = re.compile(r'^\.[a-z0-9]{1,10}$')
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_PREFIX + '/')
+
+
+def blob_name(digest, extension):
+    return posixpath.join(BLOB_PREFIX, digest[:2], digest[2:4], digest + extension)
+
+
+@deconstructible(path='core.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # The final name is only known once the content is hashed in _save()
+        return name
+
+    def _save(self, name, content):
+        extension = posixpath.splitext(name)[1].lower()
+        extension = extension if EXTENSION_RE.match(extension) else ''
+
+        tmp_dir = self.path(posixpath.join(BLOB_PREFIX, TMP_DIR))
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    tmp.write(chunk)
+
+            name = blob_name(digest.hexdigest(), extension)
+            full_path = self.path(name)
+            if os.path.exists(full_path):
+                # Seen before; refreshing the mtime keeps the GC grace period from reclaiming it now
+                os.utime(full_path)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp_path, self.file_permissions_mode)
+                # Atomic, so a concurrent upload of the same bytes just replaces it with an identical file
+                os.replace(tmp_path, full_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return name
+
+
+blob_storage = ContentAddressedStorage()
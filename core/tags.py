@@ -0,0 +1,135 @@
+"""
+Hashtags: bulk resolution and recent activity.
+
+Attaching tags one at a time costs a get_or_create, an M2M insert, a count
+and a save per hashtag. ``attach_tags`` resolves every name (by slug) in one
+lookup, creates the missing ones in one insert, links them in one insert and
+bumps ``usage_count`` in one ``UPDATE``.
+
+Each attach also counts the post in an hourly ``TagActivity`` bucket, so
+"trending now" over 1h/24h/7d is a sum over at most 169 buckets instead of
+the all-time ``usage_count``.
+"""
+
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import autocomplete, fragments, fulltext
+from .models import Post, Tag, TagActivity
+
+HASHTAG_RE = re.compile(r'#(\w+)')
+
+# Windows accepted by ``trending_tags``
+WINDOWS = {
+    '1h': timedelta(hours=1),
+    '24h': timedelta(hours=24),
+    '7d': timedelta(days=7),
+}
+
+
+def extract_hashtags(*texts):
+    """Unique, lower-cased hashtag names from the given texts, in order of first appearance."""
+    names = {}
+    for text in texts:
+        for name in HASHTAG_RE.findall(text or ''):
+            name = name.lower()[:Tag._meta.get_field('name').max_length]
+            # Tags without an ASCII slug cannot be linked to; skip them like the tag page would
+            if slugify(name):
+                names.setdefault(name, None)
+    return list(names)
+
+
+def resolve_tags(names):
+    """
+    Return ``Tag`` objects for ``names``, creating the missing ones in bulk.
+
+    Tags are matched by slug, which is what makes them unique in URLs: names
+    that slugify alike (``café`` and ``cafe``) resolve to the same tag, once.
+    """
+    slugs = {}
+    for name in names:
+        slugs.setdefault(slugify(name), name)
+    tags = {tag.slug: tag for tag in Tag.objects.filter(slug__in=slugs)}
+    missing = [slug for slug in slugs if slug not in tags]
+    if missing:
+        # Another request may create the same tag concurrently; the re-read picks up either row
+        Tag.objects.bulk_create([Tag(name=slugs[slug], slug=slug) for slug in missing], ignore_conflicts=True)
+        created = list(Tag.objects.filter(slug__in=missing))
+        # bulk_create sends no post_save, so index the new tags for search and autocomplete here
+        fulltext.index_tags(created)
+        autocomplete.add_tags(created)
+        tags.update((tag.slug, tag) for tag in created)
+    return [tags[slug] for slug in slugs if slug in tags]
+
+
+def attach_tags(post, names):
+    """Link ``post`` to the named tags and count one more use of each; returns the tags."""
+    if not names:
+        return []
+    tags = resolve_tags(names)
+    through = Post.tags.through
+    through.objects.bulk_create(
+        [through(post_id=post.pk, tag_id=tag.pk) for tag in tags],
+        ignore_conflicts=True,
+    )
+    Tag.objects.filter(pk__in=[tag.pk for tag in tags]).update(usage_count=F('usage_count') + 1)
+    autocomplete.count_tag_uses([tag.pk for tag in tags])
+    record_activity([tag.pk for tag in tags], post.created_at)
+    # bulk_create sends no m2m_changed; cached cards must pick up the new tags
+    fragments.bump_post(post.pk)
+    return tags
+
+
+def hour_bucket(at):
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+def record_activity(tag_ids, at):
+    """Count one more post for each tag in the hourly bucket containing ``at``."""
+    if not tag_ids:
+        return
+    bucket = hour_bucket(at)
+    TagActivity.objects.bulk_create(
+        [TagActivity(tag_id=tag_id, bucket=bucket) for tag_id in tag_ids],
+        ignore_conflicts=True,
+    )
+    TagActivity.objects.filter(tag_id__in=tag_ids, bucket=bucket).update(count=F('count') + 1)
+
+
+def trending_tags(window='24h', limit=20, now=None):
+    """
+    Tags with the most new posts over a recent window, most active first.
+
+    Each returned ``Tag`` carries a ``recent_count`` attribute. ``window`` is
+    one of ``WINDOWS``; the current, partial hour is always included.
+    """
+    now = now or timezone.now()
+    since = hour_bucket(now - WINDOWS[window])
+    # Bounded on both sides, the range is read from tag_activity_recent_idx
+    # instead of scanning the whole table in tag order
+    totals = list(
+        TagActivity.objects.filter(bucket__range=(since, hour_bucket(now)))
+        .values('tag_id')
+        .annotate(total=Sum('count'))
+        .order_by('-total', 'tag_id')
+        .values_list('tag_id', 'total')[:limit]
+    )
+    tags = Tag.objects.in_bulk([tag_id for tag_id, _ in totals])
+    result = []
+    for tag_id, total in totals:
+        tag = tags[tag_id]
+        tag.recent_count = total
+        result.append(tag)
+    return result
+
+
+def prune_activity(keep=None, now=None):
+    """Delete buckets older than ``keep`` (default ``TAG_ACTIVITY_RETENTION_DAYS``); returns the number removed."""
+    keep = keep or timedelta(days=getattr(settings, 'TAG_ACTIVITY_RETENTION_DAYS', 8))
+    deleted, _ = TagActivity.objects.filter(bucket__lt=hour_bucket((now or timezone.now()) - keep)).delete()
+    return deleted
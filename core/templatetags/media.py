@@ -0,0 +1,38 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from core.media import is_current
+
+register = template.Library()
+
+
+def _srcset(storage, entries):
+    return ', '.join(f"{storage.url(entry['name'])} {entry['width']}w" for entry in entries)
+
+
+@register.simple_tag
+def responsive_image(image, renditions, sizes='100vw', **attrs):
+    """
+    ``<picture>`` offering the WebP and JPEG renditions of ``image`` with ``srcset``/``sizes``.
+
+    Falls back to a plain ``<img>`` of the original while renditions are missing
+    or belong to an earlier upload. Extra keyword arguments (``alt``, ``class``)
+    become attributes of the ``<img>``.
+    """
+    if not image:
+        return ''
+    if not is_current(image, renditions) or not renditions.get('jpeg'):
+        return format_html('<img src="{}"{}>', image.url, flatatt(attrs))
+
+    storage = default_storage
+    jpeg = renditions['jpeg']
+    return format_html(
+        '<picture class="responsive-image">'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{}>'
+        '</picture>',
+        _srcset(storage, renditions.get('webp', ())), sizes,
+        storage.url(jpeg[-1]['name']), _srcset(storage, jpeg), sizes, flatatt(attrs),
+    )
@@ -0,0 +1,146 @@
+"""
+Fan-out-on-write home timelines.
+
+Every post is pushed into a ``TimelineEntry`` row for its author and each of
+their followers when it is created, so reading the feed is an indexed range
+scan over ``(user, created_at)`` instead of an ``IN`` over everyone followed.
+
+Authors with more than ``TIMELINE_FANOUT_THRESHOLD`` followers are not fanned
+out; their posts are pulled at read time and merged into the page. When an
+unfollow brings one back down to the threshold, their recent posts are copied
+into every follower's timeline, since the ones made while they were pulled
+were never pushed.
+"""
+
+from itertools import islice
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import pagination
+from .models import Post, Follow, TimelineEntry, UserProfile
+
+FANOUT_THRESHOLD = getattr(settings, 'TIMELINE_FANOUT_THRESHOLD', 5000)
+BACKFILL_LIMIT = getattr(settings, 'TIMELINE_BACKFILL_LIMIT', 200)
+BATCH_SIZE = 1000
+
+
+def is_pull_author(author_id):
+    """Authors above the follower threshold are read on demand instead of fanned out."""
+    return UserProfile.objects.filter(
+        user_id=author_id, followers_count__gt=FANOUT_THRESHOLD
+    ).exists()
+
+
+def pull_author_ids(user):
+    """Followed authors whose posts are not materialized in the timeline."""
+    # Same source as is_pull_author, so an author near the threshold is either fanned out or pulled, never neither
+    return list(UserProfile.objects.filter(
+        user_id__in=Follow.objects.filter(follower=user).values('following_id'),
+        followers_count__gt=FANOUT_THRESHOLD,
+    ).values_list('user_id', flat=True))
+
+
+def fan_out_post(post):
+    """Push a new post into its author's timeline and, for regular authors, their followers'."""
+    reader_ids = [post.author_id]
+    if not is_pull_author(post.author_id):
+        reader_ids += Follow.objects.filter(following_id=post.author_id).values_list('follower_id', flat=True)
+
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=reader_id, post=post, author_id=post.author_id, created_at=post.created_at)
+            for reader_id in reader_ids
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id, limit=BACKFILL_LIMIT):
+    """Copy an author's most recent posts into a new follower's timeline."""
+    if is_pull_author(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by('-created_at', '-id').values_list('id', 'created_at')[:limit]
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post_id=post_id, author_id=author_id, created_at=created_at)
+            for post_id, created_at in posts
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_followers(author_id, limit=BACKFILL_LIMIT):
+    """Copy an author's most recent posts into all their followers' timelines."""
+    posts = list(
+        Post.objects.filter(author_id=author_id).order_by('-created_at', '-id').values_list('id', 'created_at')[:limit]
+    )
+    if not posts:
+        return
+    follower_ids = Follow.objects.filter(following_id=author_id).values_list('follower_id', flat=True)
+    entries = (
+        TimelineEntry(user_id=follower_id, post_id=post_id, author_id=author_id, created_at=created_at)
+        for follower_id in follower_ids.iterator(chunk_size=BATCH_SIZE)
+        for post_id, created_at in posts
+    )
+    while batch := list(islice(entries, BATCH_SIZE)):
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def trim(user_id, author_id):
+    """Drop an unfollowed author's posts from a timeline."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild(user):
+    """Rebuild one user's timeline from scratch: their own posts plus everyone they follow."""
+    TimelineEntry.objects.filter(user=user).delete()
+    backfill(user.id, user.id)
+    for author_id in Follow.objects.filter(follower=user).values_list('following_id', flat=True):
+        backfill(user.id, author_id)
+
+
+def read_timeline(user, cursor=None, per_page=10):
+    """Return one ``CursorPage`` of the user's home feed, newest first."""
+    direction, key = pagination.decode_cursor(cursor, pagination.key_fields(TimelineEntry, ('created_at', 'post')))
+    reverse = direction == 'prev'
+
+    entries = pagination.seek(TimelineEntry.objects.filter(user=user), ('-created_at', '-post_id'), key, reverse)
+    keys = list(entries.values_list('created_at', 'post_id')[:per_page + 1])
+
+    pull_ids = pull_author_ids(user)
+    if pull_ids:
+        pulled = pagination.seek(Post.objects.filter(author_id__in=pull_ids), ('-created_at', '-id'), key, reverse)
+        keys += pulled.values_list('created_at', 'id')[:per_page + 1]
+        # An author may have crossed the threshold after some posts were fanned out
+        keys = sorted(set(keys), reverse=not reverse)
+
+    page = pagination.page_from_rows(keys[:per_page + 1], per_page, direction, key=lambda row: row)
+    posts = Post.objects.filter(id__in=[post_id for _, post_id in page]).select_related(
+        'author', 'author__profile'
+    ).prefetch_related('tags').order_by('-created_at', '-id')
+    page.object_list = list(posts)
+    return page
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    if created:
+        fan_out_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_on_follow(sender, instance, created, **kwargs):
+    if created:
+        backfill(instance.follower_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_on_unfollow(sender, instance, **kwargs):
+    trim(instance.follower_id, instance.following_id)
+    # The follow count signal has already run: exactly at the threshold means this unfollow crossed it
+    if UserProfile.objects.filter(user_id=instance.following_id, followers_count=FANOUT_THRESHOLD).exists():
+        backfill_followers(instance.following_id)
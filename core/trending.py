@@ -0,0 +1,183 @@
+"""
+Precomputed, time-decayed trending scores for Explore.
+
+Each engagement of weight ``w`` at time ``t`` contributes ``w * 2^(t / H)``
+to a post's score, where ``H`` is ``TRENDING_HALF_LIFE_HOURS``. Relative to
+"now" that is exactly a weight halving every ``H`` hours, but because the
+factor only depends on the event time, existing scores never have to be
+rewritten as time passes. Scores are kept as log2 of that sum so the growing
+exponent cannot overflow.
+
+Likes and comments, and their removal, are valued at the time they
+happened (a removed like takes back exactly what it added) and queued per
+process; the queue is applied whenever counter changes reach the database, so
+trending writes are batched with the counter buffer's flushes. Scores are
+rebuilt from scratch by ``manage.py recompute_trending``, which also drops
+posts that have aged out of ``TRENDING_WINDOW_DAYS``.
+"""
+
+import math
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import counter_buffer
+from .counter_buffer import counters_changed
+from .models import Post, Like, Comment, TrendingScore
+
+EPOCH = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+DEFAULT_WEIGHTS = {'post': 1.0, 'likes_count': 1.0, 'comments_count': 2.0}
+
+# post_id -> [log2 of contributions added, log2 of contributions removed], not yet applied
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def half_life():
+    return timedelta(hours=getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 24))
+
+
+def window():
+    return timedelta(days=getattr(settings, 'TRENDING_WINDOW_DAYS', 7))
+
+
+def weight(kind):
+    return getattr(settings, 'TRENDING_WEIGHTS', DEFAULT_WEIGHTS)[kind]
+
+
+def log_contribution(weight, at):
+    """log2 of ``weight * 2^((at - EPOCH) / half-life)``."""
+    return math.log2(weight) + (at - EPOCH) / half_life()
+
+
+def log_add(a, b):
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def log_sub(a, b):
+    """log2(2^a - 2^b), or ``-inf`` when ``b >= a``."""
+    if b >= a:
+        return -math.inf
+    return a + math.log2(1 - 2 ** (b - a))
+
+
+def score_post(created_at, like_times=(), comment_times=()):
+    score = log_contribution(weight('post'), created_at)
+    for at in like_times:
+        score = log_add(score, log_contribution(weight('likes_count'), at))
+    for at in comment_times:
+        score = log_add(score, log_contribution(weight('comments_count'), at))
+    return score
+
+
+def top_posts(now=None):
+    """Posts inside the trending window; order by ``('-trending__score', '-id')`` to read the top-N."""
+    now = now or timezone.now()
+    return Post.objects.filter(trending__created_at__gte=now - window()).select_related('trending')
+
+
+def bump(contributions):
+    """Apply ``{post_id: (added, removed)}``, log2 sums of engagement contributions, to the stored scores."""
+    with transaction.atomic():
+        rows = TrendingScore.objects.select_for_update().in_bulk(list(contributions))
+        for post_id, (added, removed) in contributions.items():
+            row = rows.get(post_id)
+            if row is None:
+                continue
+            # Never below the score the post started with (recompute repairs any rounding drift)
+            floor = log_contribution(weight('post'), row.created_at)
+            row.score = max(log_sub(log_add(row.score, added), removed), floor)
+        TrendingScore.objects.bulk_update(rows.values(), ['score'])
+
+
+def record(post_id, field, at, removed=False):
+    """Queue a like or comment made at ``at`` (or, with ``removed``, its removal)."""
+    contribution = log_contribution(weight(field), at)
+    with _pending_lock:
+        entry = _pending.setdefault(post_id, [-math.inf, -math.inf])
+        entry[removed] = log_add(entry[removed], contribution)
+    if not counter_buffer.enabled():
+        # Counters are written inline and counters_changed was already sent for this change
+        apply_pending()
+
+
+def apply_pending():
+    global _pending
+    with _pending_lock:
+        pending, _pending = _pending, {}
+    if pending:
+        bump(pending)
+
+
+@receiver(post_save, sender=Post)
+def seed_new_post(sender, instance, created, **kwargs):
+    if created:
+        TrendingScore.objects.create(
+            post=instance, score=score_post(instance.created_at), created_at=instance.created_at
+        )
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_save, sender=Comment)
+def engagement_added(sender, instance, created, **kwargs):
+    if created:
+        record(instance.post_id, 'likes_count' if sender is Like else 'comments_count', instance.created_at)
+
+
+@receiver(post_delete, sender=Like)
+@receiver(post_delete, sender=Comment)
+def engagement_removed(sender, instance, **kwargs):
+    record(instance.post_id, 'likes_count' if sender is Like else 'comments_count', instance.created_at, removed=True)
+
+
+@receiver(counters_changed)
+def bump_on_engagement(sender, **kwargs):
+    apply_pending()
+
+
+def recompute(now=None, batch_size=500):
+    """Rebuild every score in the window from raw likes and comments; returns ``(scored, pruned)``."""
+    now = now or timezone.now()
+    since = now - window()
+    pruned, _ = TrendingScore.objects.filter(created_at__lt=since).delete()
+
+    scored = 0
+    last_pk = 0
+    while True:
+        posts = list(
+            Post.objects.filter(created_at__gte=since, pk__gt=last_pk).order_by('pk').values_list('pk', 'created_at')[:batch_size]
+        )
+        if not posts:
+            break
+        last_pk = posts[-1][0]
+        ids = [pk for pk, _ in posts]
+
+        likes, comments = {}, {}
+        for post_id, at in Like.objects.filter(post_id__in=ids).values_list('post_id', 'created_at'):
+            likes.setdefault(post_id, []).append(at)
+        for post_id, at in Comment.objects.filter(post_id__in=ids).values_list('post_id', 'created_at'):
+            comments.setdefault(post_id, []).append(at)
+
+        TrendingScore.objects.bulk_create(
+            [
+                TrendingScore(
+                    post_id=pk,
+                    score=score_post(created_at, likes.get(pk, ()), comments.get(pk, ())),
+                    created_at=created_at,
+                )
+                for pk, created_at in posts
+            ],
+            update_conflicts=True,
+            unique_fields=['post'],
+            update_fields=['score', 'created_at'],
+        )
+        scored += len(posts)
+
+    return scored, pruned
@@ -21,17 +21,25 @@ urlpatterns = [
     
     # Social
     path('follow/<str:username>/', views.follow_user, name='follow_user'),
+    path('suggestions/', views.suggestions, name='suggestions'),
+    path('suggestions/api/', views.suggestions_api, name='suggestions_api'),
     
     # Explore & Tags
     path('explore/', views.explore, name='explore'),
     path('tag/<str:tag_slug>/', views.tag_posts, name='tag_posts'),
+    path('tags/trending/', views.trending_tags_api, name='trending_tags'),
+    path('search/', views.search, name='search'),
+    path('autocomplete/', views.autocomplete_api, name='autocomplete'),
     
     # Notifications
     path('notifications/', views.view_notifications, name='view_notifications'),
+    path('notifications/queue/', views.notification_queue_stats, name='notification_queue_stats'),
+    path('badges/', views.badge_counts, name='badge_counts'),
     
     # Messaging
     path('messages/', views.chat_list, name='chat_list'),
     path('chat/<str:username>/', views.chat, name='chat'),
     path('send-message/<str:username>/', views.send_message, name='send_message'),
     path('get-messages/<str:username>/', views.get_messages, name='get_messages'),
+    path('stream-messages/<str:username>/', views.stream_messages, name='stream_messages'),
 ]
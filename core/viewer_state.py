@@ -0,0 +1,40 @@
+"""
+What the current viewer has done to a page of posts.
+
+Templates only need a yes/no per post, so instead of prefetching every like
+we ask the database one ``EXISTS`` question per post on the page, all in one
+query bounded by the page size.
+"""
+
+from collections import namedtuple
+
+from django.db.models import Exists, OuterRef
+
+from .models import Post, Like
+
+ViewerState = namedtuple('ViewerState', ['liked'])
+
+NO_STATE = ViewerState(liked=False)
+
+
+def resolve(user, post_ids):
+    """Map each post id to a ``ViewerState`` for ``user``."""
+    post_ids = list(post_ids)
+    if not post_ids or not user.is_authenticated:
+        return {post_id: NO_STATE for post_id in post_ids}
+
+    rows = Post.objects.filter(id__in=post_ids).annotate(
+        liked=Exists(Like.objects.filter(user=user, post=OuterRef('pk'))),
+    ).values_list('id', 'liked')
+
+    states = {post_id: ViewerState(*flags) for post_id, *flags in rows}
+    return {post_id: states.get(post_id, NO_STATE) for post_id in post_ids}
+
+
+def attach(user, posts):
+    """Set ``post.viewer`` on each post so templates can read ``post.viewer.liked``."""
+    posts = list(posts)
+    states = resolve(user, [post.id for post in posts])
+    for post in posts:
+        post.viewer = states[post.id]
+    return posts
@@ -1,16 +1,26 @@
+import json
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import LoginView, LogoutView
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.db.models import Q, Count
-from django.http import JsonResponse
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
 from django.views.decorators.http import require_POST
-from django.core.paginator import Paginator
-from datetime import datetime, timezone
-from .models import UserProfile, Post, Like, Comment, Follow, Notification, Tag, Message
+from asgiref.sync import sync_to_async
+from .models import UserProfile, Post, Like, Comment, Follow, Notification, Tag, Message, Conversation
 from .forms import UserRegistrationForm, UserProfileForm, PostForm, CommentForm
+from . import autocomplete, badges, conversations, counter_buffer, follow_graph, fragments, fulltext, notifications, relationships, timeline, trending, viewer_state
+from .broker import chat_channel, get_broker
+from .db import read_only
+from .pagination import CursorPaginator
+from .tags import WINDOWS as TAG_WINDOWS, extract_hashtags, attach_tags, trending_tags
 
 
 def signup(request):
@@ -41,30 +51,29 @@ class CustomLogoutView(LogoutView):
 
 
 @login_required
+@read_only
 def profile(request, username):
     profile_user = get_object_or_404(User, username=username)
     user_profile = profile_user.profile
-    posts = Post.objects.filter(author=profile_user).order_by('-created_at')
+    posts = Post.objects.filter(author=profile_user)
     
     # Check if current user follows this profile
     is_following = False
     if request.user.is_authenticated and request.user != profile_user:
-        is_following = Follow.objects.filter(
-            follower=request.user,
-            following=profile_user
-        ).exists()
+        is_following = follow_graph.is_following(request.user.id, profile_user.id)
     
     # Pagination
-    paginator = Paginator(posts, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(posts, ('-created_at', '-id'), 12)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    counter_buffer.apply_pending(page_obj)
+    fragments.attach_versions(page_obj)
     
     context = {
         'profile_user': profile_user,
         'user_profile': user_profile,
         'posts': page_obj,
         'is_following': is_following,
-        'post_count': posts.count(),
+        'post_count': user_profile.posts_count,
     }
     
     return render(request, 'core/profile.html', context)
@@ -85,26 +94,18 @@ def edit_profile(request):
 
 
 @login_required
+@read_only
 def feed(request):
-    # Get posts from users that the current user follows
-    following_users = Follow.objects.filter(follower=request.user).values_list('following', flat=True)
-    posts = Post.objects.filter(
-        Q(author__in=following_users) | Q(author=request.user)
-    ).select_related('author', 'author__profile').prefetch_related(
-        'post_likes', 'post_comments', 'tags'
-    ).order_by('-created_at')
-    
-    # Get liked post IDs for the current user
-    liked_post_ids = set(Like.objects.filter(user=request.user).values_list('post_id', flat=True))
+    # Posts are pushed into each reader's timeline when they are created
+    page_obj = timeline.read_timeline(request.user, cursor=request.GET.get('cursor'), per_page=10)
     
-    # Pagination
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Whether the viewer liked each post on this page
+    viewer_state.attach(request.user, page_obj)
+    counter_buffer.apply_pending(page_obj)
+    fragments.attach_versions(page_obj)
     
     context = {
         'posts': page_obj,
-        'liked_post_ids': liked_post_ids,
     }
     
     return render(request, 'core/feed.html', context)
@@ -119,16 +120,9 @@ def create_post(request):
             post.author = request.user
             post.save()
             
-            # Handle tags
-            tags_input = form.cleaned_data.get('tags_input', '')
-            if tags_input:
-                tag_names = [tag.strip('#').strip() for tag in tags_input.split() if tag.strip().startswith('#')]
-                for tag_name in tag_names:
-                    if tag_name:
-                        tag, created = Tag.objects.get_or_create(name=tag_name.lower())
-                        post.tags.add(tag)
-                        tag.usage_count = tag.posts.count()
-                        tag.save()
+            # Handle tags from both the tags field and hashtags in the content
+            tag_names = extract_hashtags(post.content, form.cleaned_data.get('tags_input', ''))
+            attach_tags(post, tag_names)
             
             messages.success(request, 'Post created successfully!')
             return redirect('feed')
@@ -141,13 +135,12 @@ def create_post(request):
 @login_required
 def post_detail(request, pk):
     post = get_object_or_404(Post.objects.select_related('author', 'author__profile').prefetch_related(
-        'post_likes', 'post_comments__user', 'post_comments__user__profile', 'tags'
+        'post_comments__user', 'post_comments__user__profile', 'tags'
     ), pk=pk)
     
     # Check if user liked this post
-    is_liked = False
-    if request.user.is_authenticated:
-        is_liked = Like.objects.filter(user=request.user, post=post).exists()
+    is_liked = viewer_state.resolve(request.user, [post.id])[post.id].liked
+    counter_buffer.apply_pending([post])
     
     comments = post.post_comments.all()
     comment_form = CommentForm()
@@ -161,13 +154,9 @@ def post_detail(request, pk):
             comment.save()
             
             # Create notification
-            if post.author != request.user:
-                Notification.objects.create(
-                    user=post.author,
-                    notification_type='comment',
-                    post=post,
-                    comment=comment
-                )
+            notifications.notify(
+                post.author_id, 'comment', request.user.id, post_id=post.id, comment_id=comment.id, at=comment.created_at
+            )
             
             messages.success(request, 'Comment added!')
             return redirect('post_detail', pk=post.pk)
@@ -191,19 +180,18 @@ def like_post(request, pk):
     if not created:
         like.delete()
         is_liked = False
+        notifications.retract(post.author_id, 'like', request.user.id, post_id=post.id, at=like.created_at)
     else:
         is_liked = True
         # Create notification
-        if post.author != request.user:
-            Notification.objects.create(
-                user=post.author,
-                notification_type='like',
-                post=post
-            )
+        notifications.notify(post.author_id, 'like', request.user.id, post_id=post.id, at=like.created_at)
+    
+    post.refresh_from_db(fields=['likes_count'])
+    counter_buffer.apply_pending([post])
     
     return JsonResponse({
         'is_liked': is_liked,
-        'likes_count': post.post_likes.count()
+        'likes_count': post.likes_count
     })
 
 
@@ -223,14 +211,11 @@ def follow_user(request, username):
     if not created:
         follow.delete()
         is_following = False
+        notifications.retract(user_to_follow.id, 'follow', request.user.id, at=follow.created_at)
     else:
         is_following = True
         # Create notification
-        Notification.objects.create(
-            user=user_to_follow,
-            notification_type='follow',
-            follower=request.user
-        )
+        notifications.notify(user_to_follow.id, 'follow', request.user.id, at=follow.created_at)
     
     return JsonResponse({
         'is_following': is_following,
@@ -239,25 +224,19 @@ def follow_user(request, username):
 
 
 @login_required
+@read_only
 def explore(request):
-    # Get trending posts (most liked posts in last 7 days)
-    from django.utils import timezone
-    from datetime import timedelta
-    
-    week_ago = timezone.now() - timedelta(days=7)
-    posts = Post.objects.filter(
-        created_at__gte=week_ago
-    ).annotate(
-        like_count=Count('post_likes')
-    ).order_by('-like_count', '-created_at')
+    # Trending posts, pre-sorted by their time-decayed engagement score
+    posts = trending.top_posts()
     
-    # Popular tags
-    popular_tags = Tag.objects.order_by('-usage_count')[:20]
+    # Tags with the most new posts today, falling back to all-time usage when it's quiet
+    popular_tags = trending_tags('24h', limit=20) or Tag.objects.order_by('-usage_count')[:20]
     
     # Pagination
-    paginator = Paginator(posts, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(posts, ('-trending__score', '-id'), 12)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    counter_buffer.apply_pending(page_obj)
+    fragments.attach_versions(page_obj)
     
     context = {
         'posts': page_obj,
@@ -267,22 +246,81 @@ def explore(request):
     return render(request, 'core/explore.html', context)
 
 
+@login_required
+@read_only
+def trending_tags_api(request):
+    window = request.GET.get('window', '24h')
+    if window not in TAG_WINDOWS:
+        return JsonResponse({'error': f"window must be one of {', '.join(TAG_WINDOWS)}"}, status=400)
+    
+    tags = trending_tags(window, limit=20)
+    
+    return JsonResponse({
+        'window': window,
+        'tags': [{'name': tag.name, 'slug': tag.slug, 'count': tag.recent_count} for tag in tags],
+    })
+
+
+@login_required
+@read_only
+def search(request):
+    query = request.GET.get('q', '').strip()
+    kind = request.GET.get('type', 'posts')
+    if kind not in fulltext.KINDS:
+        kind = 'posts'
+    
+    # Best matches first, paged by rank
+    results = fulltext.search(query, kind, cursor=request.GET.get('cursor'), per_page=20)
+    if kind == 'posts':
+        counter_buffer.apply_pending(results)
+    
+    context = {
+        'query': query,
+        'kind': kind,
+        'kinds': list(fulltext.KINDS),
+        'results': results,
+    }
+    
+    return render(request, 'core/search.html', context)
+
+
+@login_required
+@read_only
+def autocomplete_api(request):
+    query = request.GET.get('q', '')
+    
+    # '@' completes usernames and '#' hashtags, straight from the in-memory index
+    sigil, prefix = query[:1], query[1:].strip()
+    if sigil not in ('@', '#'):
+        return JsonResponse({'error': "q must start with '@' or '#'"}, status=400)
+    kind = 'users' if sigil == '@' else 'tags'
+    
+    return JsonResponse({
+        'query': query,
+        'results': [
+            {'value': f'{sigil}{name}', 'name': name, 'count': score}
+            for name, _, score in autocomplete.suggest(kind, prefix[:100], limit=8)
+        ],
+    })
+
+
 @login_required
 def view_notifications(request):
     notifications_queryset = Notification.objects.filter(
         user=request.user
-    ).select_related('post', 'comment', 'follower').order_by('-created_at')
+    ).select_related('post').order_by('-updated_at')
     
     # Mark as read
     if request.method == 'POST':
-        notifications_queryset.update(is_read=True)
+        notifications_queryset.filter(is_read=False).update(is_read=True)
+        badges.reset('notifications', request.user.id)
         return redirect('view_notifications')
     
-    # Get unread count before slicing
-    unread_count = notifications_queryset.filter(is_read=False).count()
+    # Maintained counter instead of a COUNT over the user's notifications
+    unread_count = badges.counts(request.user.id)['notifications']
     
     # Slice the queryset for display
-    notifications_list = notifications_queryset[:50]
+    notifications_list = notifications.attach_actors(notifications_queryset[:50])
     
     context = {
         'notifications': notifications_list,
@@ -293,15 +331,27 @@ def view_notifications(request):
 
 
 @login_required
+def badge_counts(request):
+    return JsonResponse(badges.counts(request.user.id))
+
+
+@staff_member_required
+def notification_queue_stats(request):
+    return JsonResponse(notifications.dispatcher.stats())
+
+
+@login_required
+@read_only
 def tag_posts(request, tag_slug):
     tag = get_object_or_404(Tag, slug=tag_slug)
     posts = Post.objects.filter(tags=tag).select_related(
         'author', 'author__profile'
-    ).prefetch_related('post_likes', 'tags').order_by('-created_at')
+    ).prefetch_related('tags')
     
-    paginator = Paginator(posts, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(posts, ('-created_at', '-id'), 12)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    counter_buffer.apply_pending(page_obj)
+    fragments.attach_versions(page_obj)
     
     context = {
         'tag': tag,
@@ -312,12 +362,13 @@ def tag_posts(request, tag_slug):
 
 
 @login_required
+@read_only
 def followers_list(request, username):
     profile_user = get_object_or_404(User, username=username)
     followers = User.objects.filter(followers__following=profile_user).select_related('profile').order_by('username')
     
     # Check which of these users the current user follows
-    following_ids = set(Follow.objects.filter(follower=request.user).values_list('following_id', flat=True))
+    following_ids = follow_graph.following_ids(request.user.id)
     
     context = {
         'profile_user': profile_user,
@@ -330,12 +381,13 @@ def followers_list(request, username):
 
 
 @login_required
+@read_only
 def following_list(request, username):
     profile_user = get_object_or_404(User, username=username)
     following = User.objects.filter(following__follower=profile_user).select_related('profile').order_by('username')
     
     # Check which of these users the current user follows
-    following_ids = set(Follow.objects.filter(follower=request.user).values_list('following_id', flat=True))
+    following_ids = follow_graph.following_ids(request.user.id)
     
     context = {
         'profile_user': profile_user,
@@ -347,35 +399,58 @@ def following_list(request, username):
     return render(request, 'core/follow_list.html', context)
 
 
+@login_required
+@read_only
+def suggestions(request):
+    # People followed by the people you follow, most mutual connections first
+    context = {
+        'users': follow_graph.suggestions(request.user, limit=30),
+    }
+    
+    return render(request, 'core/suggestions.html', context)
+
+
+@login_required
+@read_only
+def suggestions_api(request):
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    
+    users = follow_graph.suggestions(request.user, limit=limit)
+    
+    return JsonResponse({
+        'users': [
+            {'username': user.username, 'mutual_count': user.mutual_count, 'followers_count': user.profile.followers_count}
+            for user in users
+        ],
+    })
+
+
+def message_payload(message):
+    """JSON shape shared by get_messages and the chat stream (minus the per-viewer ``is_sender``)."""
+    return {
+        'id': message.id,
+        'content': message.content,
+        'sender_username': message.sender.username,
+        'created_at': message.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'time_display': message.created_at.strftime('%I:%M %p'),
+    }
+
+
 @login_required
 def chat_list(request):
-    # Get all conversations (users you've messaged or who've messaged you)
-    messages_sent = Message.objects.filter(sender=request.user).values_list('receiver', flat=True).distinct()
-    messages_received = Message.objects.filter(receiver=request.user).values_list('sender', flat=True).distinct()
-    all_conversations = set(list(messages_sent) + list(messages_received))
-    
-    # Get last message for each conversation
-    conversations = []
-    for user_id in all_conversations:
-        other_user = User.objects.get(id=user_id)
-        last_message = Message.objects.filter(
-            Q(sender=request.user, receiver=other_user) | Q(sender=other_user, receiver=request.user)
-        ).order_by('-created_at').first()
-        
-        unread_count = Message.objects.filter(sender=other_user, receiver=request.user, is_read=False).count()
-        
-        conversations.append({
-            'user': other_user,
-            'last_message': last_message,
-            'unread_count': unread_count,
-        })
-    
-    # Sort by last message time
-    from datetime import datetime
-    conversations.sort(key=lambda x: x['last_message'].created_at if x['last_message'] else datetime.min.replace(tzinfo=timezone.utc), reverse=True)
+    # One summary row per conversation partner, most recent first
+    conversations_queryset = Conversation.objects.filter(
+        owner=request.user
+    ).select_related('partner', 'partner__profile')
+    
+    paginator = CursorPaginator(conversations_queryset, ('-last_message_at', '-id'), 20)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     context = {
-        'conversations': conversations,
+        'conversations': page_obj,
     }
     
     return render(request, 'core/chat_list.html', context)
@@ -386,24 +461,25 @@ def chat(request, username):
     other_user = get_object_or_404(User, username=username)
     
     # Only allow chat if users follow each other
-    is_following = Follow.objects.filter(follower=request.user, following=other_user).exists()
-    follows_me = Follow.objects.filter(follower=other_user, following=request.user).exists()
-    
-    if not (is_following or follows_me) and request.user != other_user:
+    if not relationships.can_message(request.user, other_user):
         messages.error(request, 'You can only message users you follow.')
         return redirect('profile', username=username)
     
     # Get all messages between current user and other user
-    messages_list = Message.objects.filter(
-        Q(sender=request.user, receiver=other_user) | Q(sender=other_user, receiver=request.user)
-    ).select_related('sender', 'sender__profile', 'receiver', 'receiver__profile').order_by('created_at')
+    messages_list = conversations.thread(
+        request.user, other_user, 'sender', 'sender__profile', 'receiver', 'receiver__profile'
+    ).order_by('created_at')
+    messages_list = list(messages_list)
     
-    # Mark messages as read
-    Message.objects.filter(sender=other_user, receiver=request.user, is_read=False).update(is_read=True)
+    # Mark messages as read; only what the other user sent moves the watermark
+    received_ids = [msg.id for msg in messages_list if msg.sender_id == other_user.id]
+    if received_ids:
+        conversations.mark_read(request.user, other_user, max(received_ids))
     
     context = {
         'other_user': other_user,
         'messages': messages_list,
+        'read_up_to': conversations.read_up_to(other_user, request.user) or 0,
     }
     
     return render(request, 'core/chat.html', context)
@@ -419,10 +495,7 @@ def send_message(request, username):
         return JsonResponse({'error': 'Message cannot be empty'}, status=400)
     
     # Only allow messaging if users follow each other
-    is_following = Follow.objects.filter(follower=request.user, following=receiver).exists()
-    follows_me = Follow.objects.filter(follower=receiver, following=request.user).exists()
-    
-    if not (is_following or follows_me) and request.user != receiver:
+    if not relationships.can_message(request.user, receiver):
         return JsonResponse({'error': 'You can only message users you follow'}, status=403)
     
     message = Message.objects.create(
@@ -431,6 +504,10 @@ def send_message(request, username):
         content=content
     )
     
+    # Push to any open chat streams once the message is visible to their catch-up queries
+    payload = message_payload(message)
+    transaction.on_commit(lambda: get_broker().publish(chat_channel(request.user.id, receiver.id), payload))
+    
     return JsonResponse({
         'success': True,
         'message_id': message.id,
@@ -442,38 +519,134 @@ def send_message(request, username):
 
 @login_required
 def get_messages(request, username):
-    other_user = get_object_or_404(User, username=username)
     last_message_id = request.GET.get('last_message_id', None)
     
+    # A client that already has everything up to this version gets a 304 without loading the thread
+    etag = quote_etag(conversations.version(request.user, username))
+    if last_message_id and etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    
+    other_user = get_object_or_404(User, username=username)
+    
     if last_message_id:
         try:
             last_message_id = int(last_message_id)
-            messages_list = Message.objects.filter(
-                Q(sender=request.user, receiver=other_user) | Q(sender=other_user, receiver=request.user),
-                id__gt=last_message_id
-            ).select_related('sender', 'sender__profile').order_by('created_at')
+            messages_list = conversations.thread(
+                request.user, other_user, 'sender', 'sender__profile', id__gt=last_message_id
+            ).order_by('id')
         except (ValueError, TypeError):
             messages_list = Message.objects.none()
     else:
-        messages_list = Message.objects.filter(
-            Q(sender=request.user, receiver=other_user) | Q(sender=other_user, receiver=request.user)
-        ).select_related('sender', 'sender__profile').order_by('-created_at')[:50]
+        messages_list = conversations.thread(
+            request.user, other_user, 'sender', 'sender__profile'
+        ).order_by('-created_at')[:50]
         messages_list = list(messages_list)
         messages_list.reverse()
     
     messages_data = []
     for msg in messages_list:
-        messages_data.append({
-            'id': msg.id,
-            'content': msg.content,
-            'sender_username': msg.sender.username,
-            'is_sender': msg.sender == request.user,
-            'created_at': msg.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'time_display': msg.created_at.strftime('%I:%M %p'),
-        })
+        messages_data.append(dict(message_payload(msg), is_sender=msg.sender == request.user))
     
-    # Mark messages as read
-    Message.objects.filter(sender=other_user, receiver=request.user, is_read=False).update(is_read=True)
+    # Mark messages as read; only what the other user sent moves the watermark
+    received_ids = [msg['id'] for msg in messages_data if not msg['is_sender']]
+    if received_ids:
+        conversations.mark_read(request.user, other_user, max(received_ids))
     
-    return JsonResponse({'messages': messages_data})
+    response = JsonResponse({
+        'messages': messages_data,
+        'read_up_to': conversations.read_up_to(other_user, request.user) or 0,
+    })
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# Chat stream: seconds between keep-alive comments on an idle connection
+STREAM_HEARTBEAT_SECONDS = 15
+
+
+@sync_to_async
+def _open_chat_stream(request, username):
+    if not request.user.is_authenticated:
+        raise PermissionDenied
+    other_user = User.objects.filter(username=username).first()
+    if other_user is None:
+        raise Http404
+    if not relationships.can_message(request.user, other_user):
+        raise PermissionDenied
+    return request.user, other_user
+
+
+@sync_to_async
+def _messages_after(user, other_user, last_message_id):
+    messages_list = conversations.thread(user, other_user, 'sender', id__gt=last_message_id).order_by('-id')[:50]
+    return [message_payload(msg) for msg in reversed(messages_list)]
 
+
+def _sse_event(payload, user):
+    data = json.dumps(dict(payload, is_sender=payload['sender_username'] == user.username))
+    return f"id: {payload['id']}\ndata: {data}\n\n"
+
+
+async def stream_messages(request, username):
+    """
+    Server-Sent Events stream of new messages in a conversation.
+    
+    Holds the connection open and waits on the chat broker, so an idle
+    conversation costs no queries. Needs an ASGI server (e.g.
+    ``uvicorn socialmedia.asgi:application``); under WSGI it answers 204 and
+    the chat page keeps polling get_messages instead.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    
+    user, other_user = await _open_chat_stream(request, username)
+    
+    # Resume after the newest message the client has, whether it reconnected or just loaded the page
+    last_message_id = 0
+    for value in (request.headers.get('Last-Event-ID'), request.GET.get('last_message_id')):
+        try:
+            last_message_id = max(last_message_id, int(value))
+        except (TypeError, ValueError):
+            pass
+    
+    async def events():
+        nonlocal last_message_id
+        # Subscribe before the catch-up query so nothing sent in between is missed
+        subscription = get_broker().subscribe(chat_channel(user.id, other_user.id))
+        try:
+            yield f'retry: {STREAM_HEARTBEAT_SECONDS * 1000}\n\n'
+            backlog = await _messages_after(user, other_user, last_message_id)
+            # Only up to the partner's last message; the reader's own may come after ones never delivered
+            received = [payload['id'] for payload in backlog if payload['sender_username'] == other_user.username]
+            if received:
+                await sync_to_async(conversations.mark_read)(user, other_user, max(received))
+            for payload in backlog:
+                last_message_id = payload['id']
+                yield _sse_event(payload, user)
+            
+            while True:
+                payload = await subscription.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                if payload is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                if payload.get('type') == 'read':
+                    # Read receipts only interest the other participant
+                    if payload['reader'] != user.username:
+                        yield f"event: read\ndata: {json.dumps(payload)}\n\n"
+                    continue
+                if payload['id'] <= last_message_id:
+                    continue
+                last_message_id = payload['id']
+                if payload['sender_username'] != user.username:
+                    await sync_to_async(conversations.mark_read)(user, other_user, payload['id'])
+                yield _sse_event(payload, user)
+        finally:
+            subscription.close()
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -14,6 +14,8 @@ django.setup()
 
 from django.contrib.auth.models import User
 from core.models import UserProfile, Post, Like, Comment, Follow, Tag, Message
+from core.tags import attach_tags
+from core import conversations
 
 # Sample data
 USERS_DATA = [
@@ -262,11 +264,7 @@ def create_posts(users):
         )
         
         # Add tags
-        for tag_name in post_data.get('tags', []):
-            tag, _ = Tag.objects.get_or_create(name=tag_name)
-            post.tags.add(tag)
-            tag.usage_count += 1
-            tag.save()
+        attach_tags(post, post_data.get('tags', []))
         
         posts.append(post)
         print(f"  ✓ Created post by {author.username}")
@@ -346,8 +344,7 @@ def create_messages(users):
                 sender=sender,
                 receiver=receiver,
                 content=message_text,
-                created_at=message_time,
-                is_read=random.choice([True, False])
+                created_at=message_time
             )
             print(f"  ✓ Message from {sender_username} to {receiver_username}")
         
@@ -358,14 +355,17 @@ def create_messages(users):
             hours_ago = random.randint(0, 23)
             message_time = datetime.now() - timedelta(days=days_ago, hours=hours_ago)
             
-            Message.objects.create(
+            reply = Message.objects.create(
                 sender=receiver,
                 receiver=sender,
                 content=message_text,
-                created_at=message_time,
-                is_read=random.choice([True, False])
+                created_at=message_time
             )
             print(f"  ✓ Message from {receiver_username} to {sender_username}")
+        
+        # Leave some conversations unread
+        if random.choice([True, False]):
+            conversations.mark_read(sender, receiver, reply.id)
 
 
 def main():
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 
 from pathlib import Path
 
+import django
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -62,6 +64,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.context_processors.badges',
             ],
         },
     },
@@ -73,11 +76,66 @@ WSGI_APPLICATION = 'socialmedia.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# Connections are kept open between requests (and checked before reuse), and
+# every SQLite connection gets SQLITE_PRAGMAS when it opens (see core/db.py).
+# Views marked read-only read through 'replica', the same file opened read-only.
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{BASE_DIR / 'db.sqlite3'}?mode=ro",
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+if django.VERSION >= (5, 1):
+    # Take the write lock when a transaction starts: a transaction that reads and
+    # then upgrades to writing fails at once with `database is locked` if another
+    # connection wrote in between, whatever the busy timeout
+    DATABASES['default']['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,  # milliseconds
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,  # KiB
+    'temp_store': 'MEMORY',
+}
+
+DATABASE_ROUTERS = ['core.db.ReadReplicaRouter']
+READ_REPLICA_ALIAS = 'replica'
+
+
+# Cache
+# Shared state lives here. The local-memory backend is per-process; point these
+# at Redis or Memcached when running several workers. 'counters' holds like and
+# comment deltas that are not in the database yet, so it must never evict them.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'counters': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'counters',
+        'OPTIONS': {'MAX_ENTRIES': 10 ** 9},
+    },
+    # Cached post-card fragments (see core/fragments.py); many and cheap to rebuild
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
 }
 
 
@@ -126,4 +184,82 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # Login/Logout URLs
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'feed'
-LOGOUT_REDIRECT_URL = 'login'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'login'
+
+# Home timeline fan-out
+# Authors with more followers than this are merged into feeds at read time
+# instead of being copied into every follower's timeline.
+TIMELINE_FANOUT_THRESHOLD = 5000
+TIMELINE_BACKFILL_LIMIT = 200
+
+# Write-behind buffer for post like/comment counters (see core/counter_buffer.py)
+COUNTER_BUFFER_ENABLED = True
+COUNTER_BUFFER_CACHE = 'counters'
+COUNTER_BUFFER_FLUSH_INTERVAL = 2.0  # seconds
+COUNTER_BUFFER_FLUSH_SIZE = 100
+
+# Explore trending scores (see core/trending.py)
+# Run `manage.py recompute_trending` periodically (e.g. hourly from cron).
+TRENDING_HALF_LIFE_HOURS = 24
+TRENDING_WINDOW_DAYS = 7
+TRENDING_WEIGHTS = {'post': 1.0, 'likes_count': 1.0, 'comments_count': 2.0}
+
+# Hourly tag activity buckets behind "trending tags"; must cover the widest window (7d)
+# Run `manage.py prune_tag_activity` daily to drop older buckets.
+TAG_ACTIVITY_RETENTION_DAYS = 8
+
+# Real-time chat (see core/broker.py)
+# The in-process broker only reaches streams served by the same process; point this
+# at a cross-process implementation when running several ASGI workers.
+CHAT_BROKER = 'core.broker.InProcessBroker'
+
+# Sessions are read through the cache so idle chat polls answered from the
+# conversation version stamp don't need a session query either.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Likes, comments and follows on the same post (or profile) within this many hours
+# are folded into one notification (see core/notifications.py)
+NOTIFICATION_COALESCE_WINDOW_HOURS = 24
+
+# Notification events are applied by a background thread in batches; spilled to the
+# PendingNotification table when the queue is full. Set ASYNC to False in tests.
+NOTIFICATION_DISPATCH_ASYNC = True
+NOTIFICATION_QUEUE_SIZE = 10000
+NOTIFICATION_BATCH_SIZE = 100
+NOTIFICATION_FLUSH_INTERVAL = 1.0  # seconds
+
+# In-process @username/#hashtag autocomplete index (see core/autocomplete.py); each
+# process reloads it this often to pick up changes made by other workers
+AUTOCOMPLETE_REFRESH_SECONDS = 600
+
+# Resized WebP/JPEG copies of uploaded images (see core/media.py), built by a thread
+# pool after upload; run `manage.py build_renditions` to fill in existing media.
+MEDIA_PIPELINE_ASYNC = True
+MEDIA_PIPELINE_WORKERS = 2
+MEDIA_RENDITION_WIDTHS = {
+    'post': (320, 640, 1080),
+    'profile': (64, 150, 320),
+}
+
+# Uploaded media are served by core.sendfile.serve with Range support. Outside DEBUG
+# they are only served from a separate origin, so an uploaded file never runs with
+# the site's cookies: point MEDIA_HOST (also in ALLOWED_HOSTS) at this app and set
+# MEDIA_URL to 'https://<MEDIA_HOST>/media/'. Behind nginx or Apache set
+# MEDIA_SENDFILE to 'x-accel-redirect' or 'x-sendfile' so the proxy streams the
+# file; for nginx, MEDIA_ACCEL_PREFIX is an `internal` location aliased to
+# MEDIA_ROOT.
+MEDIA_HOST = None
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+MEDIA_MAX_AGE = 86400  # seconds
+
+# Post images, videos and profile pictures are stored once per distinct content
+# under MEDIA_ROOT/blobs/ (see core/storage.py). Run `manage.py gc_media_blobs`
+# daily to delete blobs nothing refers to any more.
+
+# In-process follow graph for follow checks and "people you may know" (see
+# core/follow_graph.py). Processes read each other's follow changes from the
+# database at most every FOLLOW_GRAPH_SYNC_SECONDS and reload it in full every
+# FOLLOW_GRAPH_REFRESH_SECONDS; unfollows are kept twice that long for them.
+FOLLOW_GRAPH_SYNC_SECONDS = 1.0
+FOLLOW_GRAPH_REFRESH_SECONDS = 3600
@@ -14,15 +14,25 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+from urllib.parse import urlsplit
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from core import sendfile
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('core.urls')),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Uploads, with Range support; hands off to the front proxy when MEDIA_SENDFILE is set.
+# Outside DEBUG only from their own origin (MEDIA_HOST), never the site's.
+if settings.DEBUG or getattr(settings, 'MEDIA_HOST', None):
+    urlpatterns.insert(1, re_path(
+        r'^%s(?P<path>.+)$' % re.escape(urlsplit(settings.MEDIA_URL).path.lstrip('/')),
+        sendfile.serve,
+        name='media',
+    ))
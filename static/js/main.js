@@ -32,6 +32,14 @@ document.addEventListener('DOMContentLoaded', function() {
         }, 5000);
     });
     
+    // Keep unread badges fresh on long-lived pages
+    if (document.querySelector('.nav-badge')) {
+        setInterval(refreshBadges, 60000);
+    }
+    
+    // @username and #hashtag suggestions
+    document.querySelectorAll('[data-autocomplete]').forEach(setupAutocomplete);
+    
     // Follow buttons in lists
     const followButtonsList = document.querySelectorAll('.follow-btn-list');
     followButtonsList.forEach(button => {
@@ -123,6 +131,115 @@ function followUser(username, buttonElement) {
     });
 }
 
+// Refresh unread notification/message badges
+function refreshBadges() {
+    fetch('/badges/')
+    .then(response => response.ok ? response.json() : null)
+    .then(data => {
+        if (!data) return;
+        document.querySelectorAll('.nav-badge').forEach(badge => {
+            const count = data[badge.dataset.badge];
+            badge.textContent = count;
+            badge.hidden = !count;
+        });
+    })
+    .catch(error => console.error('Error refreshing badges:', error));
+}
+
+// Suggest @usernames and #hashtags for the word being typed in a field
+function setupAutocomplete(field) {
+    const menu = document.createElement('ul');
+    menu.className = 'autocomplete-menu';
+    menu.hidden = true;
+    document.body.appendChild(menu);
+    let active = -1;
+    let pending = null;
+    
+    function currentToken() {
+        const before = field.value.slice(0, field.selectionStart);
+        const match = before.match(/(^|\s)([@#]\w*)$/);
+        return match ? { text: match[2], start: before.length - match[2].length } : null;
+    }
+    
+    function close() {
+        menu.hidden = true;
+        menu.innerHTML = '';
+        active = -1;
+    }
+    
+    function choose(item) {
+        const token = currentToken();
+        if (!token) return close();
+        const after = field.value.slice(field.selectionStart);
+        const value = item.dataset.value + ' ';
+        field.value = field.value.slice(0, token.start) + value + after.replace(/^\w*/, '');
+        const caret = token.start + value.length;
+        field.setSelectionRange(caret, caret);
+        field.focus();
+        close();
+    }
+    
+    function highlight(index) {
+        const items = menu.querySelectorAll('li');
+        if (!items.length) return;
+        active = (index + items.length) % items.length;
+        items.forEach((item, i) => item.classList.toggle('active', i === active));
+    }
+    
+    field.addEventListener('input', function() {
+        const token = currentToken();
+        if (!token) return close();
+        if (pending) pending.abort();
+        pending = new AbortController();
+        fetch(`/autocomplete/?q=${encodeURIComponent(token.text)}`, { signal: pending.signal })
+        .then(response => response.ok ? response.json() : null)
+        .then(data => {
+            if (!data || !data.results.length) return close();
+            menu.innerHTML = '';
+            data.results.forEach(result => {
+                const item = document.createElement('li');
+                item.dataset.value = result.value;
+                item.textContent = result.value;
+                const count = document.createElement('span');
+                count.className = 'autocomplete-count';
+                count.textContent = result.count;
+                item.appendChild(count);
+                item.addEventListener('mousedown', function(e) {
+                    e.preventDefault();
+                    choose(this);
+                });
+                menu.appendChild(item);
+            });
+            const rect = field.getBoundingClientRect();
+            menu.style.left = `${rect.left + window.scrollX}px`;
+            menu.style.top = `${rect.bottom + window.scrollY}px`;
+            menu.style.minWidth = `${Math.min(rect.width, 240)}px`;
+            menu.hidden = false;
+            highlight(0);
+        })
+        .catch(error => {
+            if (error.name !== 'AbortError') console.error('Error fetching suggestions:', error);
+        });
+    });
+    
+    field.addEventListener('keydown', function(e) {
+        if (menu.hidden) return;
+        if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+            e.preventDefault();
+            highlight(active + (e.key === 'ArrowDown' ? 1 : -1));
+        } else if ((e.key === 'Enter' || e.key === 'Tab') && active >= 0) {
+            // Keep Enter from also submitting the form
+            e.preventDefault();
+            e.stopImmediatePropagation();
+            choose(menu.querySelectorAll('li')[active]);
+        } else if (e.key === 'Escape') {
+            close();
+        }
+    });
+    
+    field.addEventListener('blur', close);
+}
+
 // Get CSRF Token
 function getCookie(name) {
     let cookieValue = null;